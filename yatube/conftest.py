@@ -0,0 +1,12 @@
+import pytest
+
+from core.runner import isolated_caches
+
+
+@pytest.fixture(scope='session', autouse=True)
+def isolated_shared_cache():
+    """То же, что TestRunner для manage.py test: при запуске через pytest
+    тесты работают со своим общим кешем, а не с файлом dev-сервера"""
+
+    with isolated_caches():
+        yield
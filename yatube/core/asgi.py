@@ -0,0 +1,201 @@
+import asyncio
+import itertools
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+
+
+class RequestAborted(Exception):
+    """Клиент отключился, не дослав тело запроса"""
+
+
+class RequestTooLarge(Exception):
+    """Тело запроса больше ASGI_MAX_BODY_SIZE"""
+
+
+class ASGIHandler:
+    """ASGI-приложение поверх синхронного Django (в Django 2.2 нет своего
+    ASGI-обработчика и асинхронных вьюх).
+
+    Тело запроса читается и ответ отдаётся клиенту в цикле событий, а в пул
+    из ASGI_THREADS потоков попадает только обработка уже полученного
+    запроса. Поэтому медленные клиенты (долгая загрузка картинки, медленная
+    сеть) не занимают потоки, и один воркер держит много таких соединений.
+    Исключение - потоковые ответы (StreamingHttpResponse, FileResponse): их
+    куски отдаются по мере получения, и поток ждёт клиента до конца ответа.
+    Весь запрос, включая закрытие ответа и сигнал request_finished,
+    выполняется в одном потоке: соединения с базой у Django свои у каждого
+    потока"""
+
+    def __init__(self, wsgi_application=None, max_workers=None):
+        self.wsgi_application = wsgi_application or get_wsgi_application()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or settings.ASGI_THREADS,
+            thread_name_prefix='asgi'
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f'Неподдерживаемый тип соединения: '
+                             f'{scope["type"]}')
+        try:
+            body = await self.read_body(scope, receive)
+        except RequestAborted:
+            return
+        except RequestTooLarge:
+            await self.send_too_large(send)
+            return
+        loop = asyncio.get_running_loop()
+
+        def send_from_thread(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        try:
+            response = await loop.run_in_executor(
+                self.executor, self.run_wsgi, self.get_environ(scope, body),
+                send_from_thread)
+        finally:
+            body.close()
+        if response is None:
+            # Потоковый ответ уже отдан из потока
+            return
+        status, headers, content = response
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': headers,
+        })
+        await send({'type': 'http.response.body', 'body': content})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, scope, receive):
+        """Тело запроса целиком, до обработки. Большие тела уходят на
+        диск, как загрузки файлов в самом Django. Тело больше
+        ASGI_MAX_BODY_SIZE отклоняется по Content-Length, а без него - как
+        только прочитанное превысит предел"""
+
+        limit = settings.ASGI_MAX_BODY_SIZE
+        length = dict(scope.get('headers', [])).get(b'content-length')
+        if length is not None and length.isdigit() and int(length) > limit:
+            raise RequestTooLarge
+        body = tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                raise RequestAborted
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > limit:
+                body.close()
+                raise RequestTooLarge
+            body.write(chunk)
+            if not message.get('more_body', False):
+                break
+        body.seek(0)
+        return body
+
+    @staticmethod
+    async def send_too_large(send):
+        await send({
+            'type': 'http.response.start',
+            'status': 413,
+            'headers': [(b'content-type', b'text/plain; charset=utf-8'),
+                        (b'connection', b'close')],
+        })
+        await send({'type': 'http.response.body',
+                    'body': b'Request body is too large'})
+
+    @staticmethod
+    def get_environ(scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', ''),
+            # WSGI передаёт путь байтами, раскодированными как latin-1
+            'PATH_INFO': scope['path'].encode().decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+            'REMOTE_ADDR': client[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                environ[name] = value
+                continue
+            key = f'HTTP_{name}'
+            if key in environ:
+                # Повторяющиеся заголовки склеиваются, cookie - через ';'
+                separator = '; ' if name == 'COOKIE' else ','
+                value = f'{environ[key]}{separator}{value}'
+            environ[key] = value
+        return environ
+
+    def run_wsgi(self, environ, send):
+        """Выполняем WSGI-приложение. Ответ из одного куска возвращается
+        целиком и отдаётся в цикле событий. Если кусков больше, ответ
+        потоковый: каждый кусок сразу уходит клиенту через send, а
+        возвращается None"""
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in headers
+            ]
+
+        result = self.wsgi_application(environ, start_response)
+        try:
+            chunks = iter(result)
+            # Генератор может вызвать start_response только на первом куске
+            first = next(chunks, b'')
+            second = next(chunks, None)
+            if second is None:
+                return response['status'], response['headers'], first
+            send({
+                'type': 'http.response.start',
+                'status': response['status'],
+                'headers': response['headers'],
+            })
+            for chunk in itertools.chain((first, second), chunks):
+                if chunk:
+                    send({'type': 'http.response.body', 'body': chunk,
+                          'more_body': True})
+            send({'type': 'http.response.body', 'body': b''})
+            return None
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+
+def get_asgi_application():
+    return ASGIHandler()
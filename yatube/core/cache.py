@@ -0,0 +1,337 @@
+import pickle
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.cache.backends import locmem
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .metrics import record_cache
+
+# Счётчик изменений общего кеша и журнал изменённых ключей по его номерам
+STAMP_KEY: str = 'l1:stamp'
+LOG_KEY: str = 'l1:log'
+LOG_TIMEOUT: int = 60 * 10
+# Если пропущено больше изменений, проще очистить L1 целиком
+MAX_LOG_GAP: int = 1000
+# Доля операций записи, после которых SQLiteCache проверяет размер таблицы
+CULL_PROBABILITY: float = 0.01
+# RETURNING появился в SQLite 3.35
+MIN_SQLITE_VERSION = (3, 35, 0)
+
+_missing = object()
+# Локальные уровни по имени общего кеша. Экземпляры бэкенда создаются в
+# каждом потоке свои, а L1 должен быть общим для всего процесса
+_local_tiers = {}
+_local_tiers_lock = threading.Lock()
+
+
+class InstrumentedCacheMixin:
+    """Считает попадания и промахи кеша для метрик запроса. get_many в
+    базовом классе вызывает get, поэтому тоже учитывается"""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _missing, version)
+        if value is _missing:
+            record_cache(0, 1)
+            return default
+        record_cache(1, 0)
+        return value
+
+
+class LocMemCache(InstrumentedCacheMixin, locmem.LocMemCache):
+    pass
+
+
+class LocalTier:
+    """LRU-кеш в памяти процесса. Значения хранятся сериализованными, чтобы
+    вызывающий код не мог изменить закешированный объект"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # Номер последнего изменения общего кеша, которое уже учтено
+        self.stamp = _missing
+        self.checked = float('-inf')
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return _missing
+            data, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                del self.entries[key]
+                return _missing
+            self.entries.move_to_end(key)
+        return pickle.loads(data)
+
+    def set(self, key, value, timeout):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires = None if timeout is None else time.monotonic() + timeout
+        with self.lock:
+            self.entries[key] = (data, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def evict(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class BaseTwoTierCache(BaseCache):
+    """Двухуровневый кеш: небольшой LRU в памяти процесса (L1) перед общим
+    для всех воркеров кешем (LOCATION - имя другого кеша из CACHES).
+
+    Каждое изменение увеличивает счётчик в общем кеше и записывает
+    изменённый ключ в журнал под этим номером. Воркер не чаще раза в
+    CHECK_INTERVAL секунд сверяет счётчик и удаляет из L1 ключи, изменённые
+    другими воркерами. Свои изменения попадают в L1 сразу"""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = location
+        self.l1_timeout = options.get('L1_TIMEOUT', 60)
+        self.check_interval = options.get('CHECK_INTERVAL', 0.5)
+        with _local_tiers_lock:
+            self.local = _local_tiers.setdefault(
+                location, LocalTier(options.get('L1_MAX_ENTRIES', 1000)))
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def local_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self.l1_timeout
+        return min(timeout, self.l1_timeout)
+
+    def sync(self):
+        """Удаляем из L1 ключи, которые изменили другие воркеры"""
+
+        local = self.local
+        now = time.monotonic()
+        if now - local.checked < self.check_interval:
+            return
+        local.checked = now
+        stamp = self.shared.get(STAMP_KEY)
+        if stamp == local.stamp:
+            return
+        if (stamp is None or not isinstance(local.stamp, int)
+                or not 0 < stamp - local.stamp <= MAX_LOG_GAP):
+            local.clear()
+        else:
+            log_keys = [f'{LOG_KEY}:{number}'
+                        for number in range(local.stamp + 1, stamp + 1)]
+            changed = self.shared.get_many(log_keys)
+            if len(changed) < len(log_keys):
+                # Часть журнала потеряна: не знаем, что изменилось
+                local.clear()
+            else:
+                local.evict(changed.values())
+        local.stamp = stamp
+
+    def publish(self, key):
+        """Сообщаем другим воркерам, что ключ изменился"""
+
+        try:
+            stamp = self.shared.incr(STAMP_KEY)
+        except ValueError:
+            self.shared.add(STAMP_KEY, 0, None)
+            stamp = self.shared.incr(STAMP_KEY)
+        self.shared.set(f'{LOG_KEY}:{stamp}', key, LOG_TIMEOUT)
+        if self.local.stamp == stamp - 1:
+            # Между нашими изменениями других не было - журнал читать незачем
+            self.local.stamp = stamp
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_key(key, version)
+        self.validate_key(local_key)
+        self.sync()
+        value = self.local.get(local_key)
+        if value is not _missing:
+            return value
+        value = self.shared.get(key, _missing, version)
+        if value is _missing:
+            return default
+        self.local.set(local_key, value, self.l1_timeout)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_key(key, version)
+        self.shared.set(key, value, timeout, version)
+        self.publish(local_key)
+        self.local.set(local_key, value, self.local_timeout(timeout))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if not self.shared.add(key, value, timeout, version):
+            return False
+        local_key = self.make_key(key, version)
+        self.publish(local_key)
+        self.local.set(local_key, value, self.local_timeout(timeout))
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        local_key = self.make_key(key, version)
+        value = self.shared.incr(key, delta, version)
+        self.publish(local_key)
+        self.local.set(local_key, value, self.l1_timeout)
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        local_key = self.make_key(key, version)
+        self.shared.delete(key, version)
+        self.publish(local_key)
+        self.local.evict([local_key])
+
+    def clear(self):
+        self.shared.clear()
+        self.local.clear()
+
+
+class TwoTierCache(InstrumentedCacheMixin, BaseTwoTierCache):
+    pass
+
+
+class SQLiteCache(BaseCache):
+    """Общий для всех процессов кеш в файле SQLite: замена Redis для
+    локальной разработки. incr выполняется одним UPDATE и поэтому атомарен.
+    Запросы используют ON CONFLICT ... DO UPDATE и RETURNING, поэтому нужен
+    SQLite не старше MIN_SQLITE_VERSION"""
+
+    def __init__(self, location, params):
+        if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+            raise ImproperlyConfigured(
+                f'SQLiteCache требует SQLite '
+                f'{".".join(map(str, MIN_SQLITE_VERSION))} или новее, '
+                f'установлен {sqlite3.sqlite_version}'
+            )
+        super().__init__(params)
+        self.path = location
+        self._connection = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, timeout=5,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)'
+            )
+            self._connection = connection
+        return self._connection
+
+    @staticmethod
+    def encode(value):
+        # Целые числа храним как есть, чтобы incr работал внутри SQLite
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def decode(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        row = self.connection.execute(
+            'SELECT value FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (key, time.time())
+        ).fetchone()
+        return default if row is None else self.decode(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        self.connection.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires) '
+            'VALUES (?, ?, ?)',
+            (key, self.encode(value), self.get_backend_timeout(timeout))
+        )
+        self.maybe_cull()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        cursor = self.connection.execute(
+            'INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+            'expires = excluded.expires '
+            'WHERE cache.expires IS NOT NULL AND cache.expires <= ?',
+            (key, self.encode(value), self.get_backend_timeout(timeout),
+             time.time())
+        )
+        self.maybe_cull()
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        row = self.connection.execute(
+            'UPDATE cache SET value = value + ? WHERE key = ? '
+            "AND typeof(value) = 'integer' "
+            'AND (expires IS NULL OR expires > ?) RETURNING value',
+            (delta, key, time.time())
+        ).fetchone()
+        if row is None:
+            raise ValueError("Key '%s' not found" % key)
+        return row[0]
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version)
+        cursor = self.connection.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, time.time())
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        self.connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def clear(self):
+        self.connection.execute('DELETE FROM cache')
+
+    def maybe_cull(self):
+        if random.random() >= CULL_PROBABILITY:
+            return
+        connection = self.connection
+        connection.execute('DELETE FROM cache WHERE expires <= ?',
+                           (time.time(),))
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            connection.execute(
+                'DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache '
+                'ORDER BY expires IS NULL, expires LIMIT ?)',
+                (count // self._cull_frequency,)
+            )
+
+    def close(self, **kwargs):
+        # Соединение с файлом живёт столько же, сколько поток
+        pass
@@ -0,0 +1,91 @@
+import random
+import sqlite3
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Ключ сессии: до какого времени читать с основной базы после записи
+STICKY_SESSION_KEY: str = '_primary_until'
+# Приложения, которые всегда читаются с основной базы: сессия после входа
+# должна быть видна сразу, иначе пользователь окажется разлогинен
+PRIMARY_APPS = frozenset(('sessions',))
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Разрешено ли читать с реплики в текущем запросе (ставит декоратор)
+replica_reads = ContextVar('replica_reads', default=False)
+# Изменения, сделанные текущим запросом (ставит middleware, отмечает роутер)
+request_writes = ContextVar('request_writes', default=None)
+
+
+class ReplicaRouter:
+    """Роутер: запись и чтение по умолчанию идут в основную базу, чтение во
+    вьюхах с декоратором use_replica - в случайную реплику из
+    DATABASE_REPLICAS"""
+
+    def db_for_read(self, model, **hints):
+        if (not replica_reads.get() or not settings.DATABASE_REPLICAS
+                or model._meta.app_label in PRIMARY_APPS
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        writes = request_writes.get()
+        if writes is not None and model._meta.app_label not in PRIMARY_APPS:
+            writes.add(model._meta.label)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии основной базы, объекты из них можно связывать
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Схема реплик приходит вместе с данными при синхронизации
+        return db not in settings.DATABASE_REPLICAS
+
+
+def is_sticky(request):
+    """Пользователь недавно что-то изменил: реплика может ещё не знать об
+    этом, поэтому его запросы читают основную базу"""
+
+    session = getattr(request, 'session', None)
+    if session is None:
+        return False
+    return session.get(STICKY_SESSION_KEY, 0) > time.time()
+
+
+def mark_sticky(request):
+    request.session[STICKY_SESSION_KEY] = (
+        time.time() + settings.REPLICA_STICKY_TIME)
+
+
+def use_replica(view):
+    """Декоратор для вьюх, которые только читают: запросы к базе идут в
+    реплику, если это безопасный метод и пользователь недавно ничего не
+    записывал"""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS or is_sticky(request):
+            return view(request, *args, **kwargs)
+        token = replica_reads.set(True)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            replica_reads.reset(token)
+    return wrapper
+
+
+def copy_database(source, path):
+    """Копируем базу соединения source в файл SQLite path через backup API:
+    копия согласована, даже если в основную базу в это время пишут"""
+
+    source.ensure_connection()
+    target = sqlite3.connect(path)
+    try:
+        source.connection.backup(target)
+    finally:
+        target.close()
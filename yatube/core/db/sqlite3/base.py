@@ -0,0 +1,71 @@
+import sqlite3
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+# Сколько раз повторять запрос, если база занята другим писателем, и пауза
+# перед первым повтором (дальше она удваивается)
+LOCK_RETRIES: int = 5
+LOCK_RETRY_DELAY: float = 0.05
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+def is_locked(error):
+    return 'database is locked' in str(error)
+
+
+class SQLiteCursorWrapper(base.SQLiteCursorWrapper):
+    """Повторяет запрос, если база занята. Повторять безопасно только
+    запросы вне транзакции (и сам BEGIN): внутри транзакции повтор не
+    поможет, её нужно откатить целиком"""
+
+    def execute(self, query, params=None):
+        return self.retry(super().execute, query, params)
+
+    def executemany(self, query, param_list):
+        return self.retry(super().executemany, query, param_list)
+
+    def retry(self, method, *args):
+        delay = LOCK_RETRY_DELAY
+        for attempt in range(LOCK_RETRIES + 1):
+            try:
+                return method(*args)
+            except sqlite3.OperationalError as error:
+                if (not is_locked(error) or attempt == LOCK_RETRIES
+                        or self.connection.in_transaction):
+                    raise
+            time.sleep(delay)
+            delay *= 2
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite-бэкенд для продакшена: PRAGMA из OPTIONS['pragmas']
+    выполняются для каждого нового соединения, транзакции начинаются с
+    OPTIONS['transaction_mode'], запросы повторяются при блокировке базы"""
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.pragmas = kwargs.pop('pragmas', {})
+        self.transaction_mode = kwargs.pop('transaction_mode', None)
+        if (self.transaction_mode is not None
+                and self.transaction_mode.upper() not in TRANSACTION_MODES):
+            raise ImproperlyConfigured(
+                f"OPTIONS['transaction_mode'] должен быть одним из "
+                f"{', '.join(TRANSACTION_MODES)}"
+            )
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def create_cursor(self, name=None):
+        return self.connection.cursor(factory=SQLiteCursorWrapper)
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            return super()._start_transaction_under_autocommit()
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.db.replicas import copy_database
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в файлы реплик из DB_REPLICAS. '
+            'С --interval работает постоянно, имитируя репликацию')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=None,
+            help='Повторять копирование каждые N секунд'
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('Реплики не настроены: задайте DB_REPLICAS')
+        source = connections[DEFAULT_DB_ALIAS]
+        while True:
+            for alias in settings.DATABASE_REPLICAS:
+                copy_database(source, connections[alias].settings_dict['NAME'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Реплики обновлены: {", ".join(settings.DATABASE_REPLICAS)}'
+            ))
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,179 @@
+import json
+import logging
+import re
+import threading
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограммы времени ответа, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PLACEHOLDER_RE = re.compile(r"%s|'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+
+# Метрики текущего запроса. ContextVar, а не глобальная переменная, чтобы
+# параллельные запросы в потоках и корутинах не смешивались
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+def sql_shape(sql):
+    """Запрос без конкретных значений: одинаковые по структуре запросы с
+    разными параметрами дают одну и ту же форму"""
+
+    return IN_LIST_RE.sub('(...)', PLACEHOLDER_RE.sub('?', sql))
+
+
+class RequestMetrics:
+    """Метрики одного запроса: SQL, шаблоны, кеш и общее время"""
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.shapes = Counter()
+
+    def execute(self, execute, sql, params, many, context):
+        """Обёртка для connection.execute_wrapper"""
+
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += perf_counter() - start
+            self.queries += 1
+            self.shapes[sql_shape(sql)] += 1
+
+    def repeated_queries(self):
+        """Формы запросов, повторившиеся не меньше N_PLUS_ONE_THRESHOLD
+        раз - признак N+1"""
+
+        return {shape: count for shape, count in self.shapes.items()
+                if count >= settings.N_PLUS_ONE_THRESHOLD}
+
+    def as_dict(self, request, response, view):
+        return {
+            'view': view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round((perf_counter() - self.start) * 1000, 3),
+            'queries': self.queries,
+            'sql_ms': round(self.sql_time * 1000, 3),
+            'template_ms': round(self.template_time * 1000, 3),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+        }
+
+
+def record_template(elapsed):
+    metrics = current_metrics.get()
+    if metrics is not None:
+        metrics.template_time += elapsed
+
+
+def record_cache(hits, misses):
+    metrics = current_metrics.get()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+class MetricsRegistry:
+    """Накопленные метрики по именам вьюх. Хранятся в памяти процесса,
+    поэтому каждый воркер отдаёт свои значения"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = Counter()
+        self.totals = defaultdict(Counter)
+        self.buckets = defaultdict(Counter)
+
+    def observe(self, record, n_plus_one):
+        view = record['view']
+        duration = record['duration_ms'] / 1000
+        with self.lock:
+            self.requests[view] += 1
+            totals = self.totals[view]
+            totals['duration'] += duration
+            totals['queries'] += record['queries']
+            totals['sql'] += record['sql_ms'] / 1000
+            totals['template'] += record['template_ms'] / 1000
+            totals['cache_hits'] += record['cache_hits']
+            totals['cache_misses'] += record['cache_misses']
+            totals['n_plus_one'] += bool(n_plus_one)
+            for bound in LATENCY_BUCKETS:
+                if duration <= bound:
+                    self.buckets[view][bound] += 1
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus"""
+
+        counters = (
+            ('queries', 'yatube_db_queries_total',
+             'Количество SQL-запросов'),
+            ('sql', 'yatube_db_duration_seconds_total',
+             'Время выполнения SQL-запросов'),
+            ('template', 'yatube_template_duration_seconds_total',
+             'Время рендеринга шаблонов'),
+            ('cache_hits', 'yatube_cache_hits_total', 'Попадания в кеш'),
+            ('cache_misses', 'yatube_cache_misses_total', 'Промахи кеша'),
+            ('n_plus_one', 'yatube_n_plus_one_total',
+             'Запросы с повторяющимися SQL-запросами (N+1)'),
+        )
+        with self.lock:
+            views = sorted(self.requests)
+            lines = [
+                '# HELP yatube_request_duration_seconds Время ответа',
+                '# TYPE yatube_request_duration_seconds histogram',
+            ]
+            for view in views:
+                label = f'view="{view}"'
+                for bound in LATENCY_BUCKETS:
+                    lines.append(
+                        'yatube_request_duration_seconds_bucket'
+                        f'{{{label},le="{bound}"}} {self.buckets[view][bound]}'
+                    )
+                lines += [
+                    'yatube_request_duration_seconds_bucket'
+                    f'{{{label},le="+Inf"}} {self.requests[view]}',
+                    f'yatube_request_duration_seconds_sum{{{label}}} '
+                    f'{self.totals[view]["duration"]}',
+                    f'yatube_request_duration_seconds_count{{{label}}} '
+                    f'{self.requests[view]}',
+                ]
+            for key, name, help_text in counters:
+                lines += [f'# HELP {name} {help_text}',
+                          f'# TYPE {name} counter']
+                lines += [f'{name}{{view="{view}"}} {self.totals[view][key]}'
+                          for view in views]
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+def finish_request(metrics, request, response):
+    """Сохраняем метрики запроса в реестр и пишем их в лог одной
+    JSON-строкой. Запросы с признаками N+1 пишутся с уровнем WARNING"""
+
+    match = getattr(request, 'resolver_match', None)
+    view = match.view_name if match else '<unresolved>'
+    record = metrics.as_dict(request, response, view)
+    n_plus_one = metrics.repeated_queries()
+    REGISTRY.observe(record, n_plus_one)
+    if n_plus_one:
+        record['n_plus_one'] = n_plus_one
+        logger.warning(json.dumps(record, ensure_ascii=False))
+    else:
+        logger.info(json.dumps(record, ensure_ascii=False))
+    return record
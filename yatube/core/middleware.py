@@ -0,0 +1,50 @@
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .db.replicas import mark_sticky, request_writes
+from .metrics import RequestMetrics, current_metrics, finish_request
+
+
+class RequestMetricsMiddleware:
+    """Собирает метрики каждого запроса: количество и время SQL-запросов,
+    время рендеринга шаблонов, попадания в кеш и общее время ответа"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.execute))
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        finish_request(metrics, request, response)
+        return response
+
+
+class ReplicaStickinessMiddleware:
+    """Если запрос что-то записал в базу, следующие запросы пользователя
+    REPLICA_STICKY_TIME секунд читают основную базу, чтобы он сразу видел
+    свои изменения. Должен стоять после SessionMiddleware"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        writes = set()
+        token = request_writes.set(writes)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_writes.reset(token)
+        if writes and settings.DATABASE_REPLICAS and hasattr(request,
+                                                             'session'):
+            mark_sticky(request)
+        return response
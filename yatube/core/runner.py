@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+# Общий кеш тестов: в памяти процесса, у каждого запуска свой
+TEST_SHARED_CACHE = {
+    'BACKEND': 'core.cache.LocMemCache',
+    'LOCATION': 'yatube-tests',
+    'OPTIONS': {'MAX_ENTRIES': 100000},
+}
+
+
+def isolated_caches():
+    """Подмена общего кеша на время тестов. Ею пользуются и TestRunner
+    (manage.py test), и conftest.py (pytest)"""
+
+    return override_settings(
+        CACHES={**settings.CACHES, 'shared': TEST_SHARED_CACHE})
+
+
+class TestRunner(DiscoverRunner):
+    """Запускает тесты со своим общим кешем. Тесты чистят кеш и оставляют в
+    нём ключи, поэтому не должны трогать кеш dev-сервера и других копий
+    проекта"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_override = isolated_caches()
+        self.cache_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_override.disable()
+        super().teardown_test_environment(**kwargs)
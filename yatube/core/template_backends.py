@@ -0,0 +1,41 @@
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.template import TemplateDoesNotExist
+from django.template.backends import django as django_backend
+
+from .metrics import record_template
+
+# Сколько рендерингов шаблонов сейчас вложено друг в друга
+render_depth = ContextVar('render_depth', default=0)
+
+
+class Template(django_backend.Template):
+    """Шаблон, который засекает время рендеринга. Время считается только у
+    шаблонов верхнего уровня: include и шаблоны, отрендеренные из кода во
+    время рендеринга страницы (например карточки постов), уже входят в её
+    время"""
+
+    def render(self, context=None, request=None):
+        token = render_depth.set(render_depth.get() + 1)
+        start = perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            elapsed = perf_counter() - start
+            render_depth.reset(token)
+            if render_depth.get() == 0:
+                record_template(elapsed)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """Стандартный движок шаблонов Django с замером времени рендеринга"""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
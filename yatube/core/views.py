@@ -1,5 +1,11 @@
+import hmac
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
 
+from .metrics import REGISTRY
+
 
 def page_not_found(request, exception):
     return render(request, 'core/404.html', {'path': request.path}, status=404)
@@ -7,3 +13,27 @@ def page_not_found(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+def metrics_allowed(request):
+    """Метрики видят сотрудники и сборщик метрик с токеном METRICS_TOKEN в
+    заголовке Authorization: Bearer. Адресу клиента не верим: за nginx
+    все запросы приходят с 127.0.0.1"""
+
+    if request.user.is_staff or request.user.is_superuser:
+        return True
+    token = settings.METRICS_TOKEN
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and hmac.compare_digest(header,
+                                               f'Bearer {token}')
+
+
+def metrics(request):
+    """Метрики запросов в текстовом формате Prometheus"""
+
+    if not metrics_allowed(request):
+        raise Http404
+    return HttpResponse(
+        REGISTRY.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
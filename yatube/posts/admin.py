@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Post, Group
+from .search import search_posts
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -14,6 +15,13 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        """Ищем по полнотекстовому индексу вместо LIKE '%term%'"""
+
+        if not search_term:
+            return queryset, False
+        return search_posts(search_term, queryset), False
+
 
 admin.site.register(Post, PostAdmin)
 
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from . import (cards, conditional, feed, likes,  # noqa: F401
+                       search, threads, trending, utils)
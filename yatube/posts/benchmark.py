@@ -0,0 +1,182 @@
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from .models import Group, Post, User
+
+# Объёмы данных для команды seed
+DATASETS = {
+    'small': {'users': 50, 'groups': 5, 'posts': 500, 'comments': 1500,
+              'follows': 300, 'likes': 1000},
+    'medium': {'users': 500, 'groups': 20, 'posts': 10000,
+               'comments': 30000, 'follows': 5000, 'likes': 20000},
+    'large': {'users': 5000, 'groups': 50, 'posts': 100000,
+              'comments': 300000, 'follows': 50000, 'likes': 200000},
+}
+PERCENTILES = (50, 90, 99)
+# Допустимый рост времени и памяти относительно базовой линии
+TOLERANCE: float = 0.25
+# Общий уровень кеша бенчмарка: свой, в памяти процесса. Бенчмарк чистит
+# кеш перед каждой вьюхой и не должен трогать кеш работающего сайта
+SHARED_CACHE_ALIAS: str = 'benchmark_shared'
+
+
+def benchmark_caches():
+    """Кеши на время бенчмарка: тот же двухуровневый кеш, но общий
+    уровень - отдельный кеш в памяти"""
+
+    return {
+        'default': {
+            **settings.CACHES['default'],
+            'LOCATION': SHARED_CACHE_ALIAS,
+        },
+        SHARED_CACHE_ALIAS: {
+            'BACKEND': 'core.cache.LocMemCache',
+            'LOCATION': SHARED_CACHE_ALIAS,
+        },
+    }
+
+
+def benchmark_settings():
+    """Настройки на время бенчмарка, в том числе генерации данных: свои
+    кеши и выключенная debug_toolbar - иначе замеряется в основном сама
+    панель"""
+
+    return override_settings(CACHES=benchmark_caches(), DEBUG=False,
+                             INTERNAL_IPS=[])
+
+
+def percentile(values, percent):
+    """Перцентиль по методу ближайшего ранга"""
+
+    ordered = sorted(values)
+    rank = max(round(percent / 100 * len(ordered) + 0.5), 1)
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def benchmark_requests():
+    """Запросы к каждой вьюхе на самых «тяжёлых» объектах датасета:
+    {имя: (метод, url, данные)} и пользователь, от имени которого
+    выполняются запросы"""
+
+    author = (User.objects.annotate(total=Count('posts'))
+              .order_by('-total', 'pk').first())
+    reader = (User.objects.annotate(total=Count('follower'))
+              .order_by('-total', 'pk').first())
+    group = (Group.objects.annotate(total=Count('posts'))
+             .order_by('-total', 'pk').first())
+    post = Post.objects.order_by('-comments_count', 'pk').first()
+    requests = {'index': ('get', reverse('posts:index'), None)}
+    if group:
+        requests['group_posts'] = (
+            'get', reverse('posts:group_list', args=(group.slug,)), None)
+    if author:
+        requests['profile'] = (
+            'get', reverse('posts:profile', args=(author.username,)), None)
+    if post:
+        requests['post_detail'] = (
+            'get', reverse('posts:post_detail', args=(post.pk,)), None)
+    requests['follow_index'] = ('get', reverse('posts:follow_index'), None)
+    # Создание постов сбрасывает кеш страниц, поэтому идёт последним
+    requests['post_create'] = (
+        'post',
+        reverse('posts:post_create'),
+        {'text': 'Пост из бенчмарка', 'group': group.pk if group else ''}
+    )
+    return requests, reader
+
+
+def measure(client, method, url, data):
+    """Время, количество запросов к базе, размер ответа и его код"""
+
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        response = getattr(client, method)(url, data)
+        elapsed = time.perf_counter() - start
+    return elapsed, len(queries), len(response.content), response.status_code
+
+
+def measure_memory(client, method, url, data):
+    """Пик выделенной Python-памяти за запрос, КБ. Отдельный проход, так как
+    tracemalloc заметно замедляет выполнение"""
+
+    tracemalloc.start()
+    try:
+        getattr(client, method)(url, data)
+        return tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_view(client, method, url, data, repeat):
+    cache.clear()
+    cold, cold_queries, _, _ = measure(client, method, url, data)
+    timings, queries, sizes, statuses = [], [], [], set()
+    for _ in range(repeat):
+        elapsed, count, size, status = measure(client, method, url, data)
+        timings.append(elapsed * 1000)
+        queries.append(count)
+        sizes.append(size)
+        statuses.add(status)
+    latency = {f'p{percent}': round(percentile(timings, percent), 3)
+               for percent in PERCENTILES}
+    latency.update(min=round(min(timings), 3), max=round(max(timings), 3),
+                   mean=round(sum(timings) / len(timings), 3))
+    return {
+        'status': sorted(statuses),
+        'cold_ms': round(cold * 1000, 3),
+        'latency_ms': latency,
+        'queries': {'cold': cold_queries, 'warm': max(queries)},
+        'bytes': max(sizes),
+        'peak_memory_kb': measure_memory(client, method, url, data),
+    }
+
+
+def run_benchmark(repeat=20, views=None):
+    """Прогоняет вьюхи через тестовый клиент на текущей базе. Первый
+    запрос после очистки кеша считается холодным, остальные - тёплыми"""
+
+    requests, reader = benchmark_requests()
+    client = Client()
+    if reader:
+        client.force_login(reader)
+    with benchmark_settings():
+        return {
+            name: benchmark_view(client, method, url, data, repeat)
+            for name, (method, url, data) in requests.items()
+            if views is None or name in views
+        }
+
+
+def compare_results(baseline, current, tolerance=TOLERANCE):
+    """Список регрессий относительно базовой линии: рост числа запросов
+    к базе, а также рост времени и памяти больше чем на tolerance"""
+
+    regressions = []
+    for dataset, views in current.items():
+        for view, result in views.items():
+            before = baseline.get(dataset, {}).get(view)
+            if before is None:
+                continue
+            checks = [
+                ('queries', before['queries']['warm'],
+                 result['queries']['warm'], 0),
+                ('p50', before['latency_ms']['p50'],
+                 result['latency_ms']['p50'], tolerance),
+                ('p90', before['latency_ms']['p90'],
+                 result['latency_ms']['p90'], tolerance),
+                ('peak_memory_kb', before['peak_memory_kb'],
+                 result['peak_memory_kb'], tolerance),
+            ]
+            for metric, old, new, allowed in checks:
+                if new > old * (1 + allowed):
+                    regressions.append(
+                        f'{dataset}/{view}: {metric} {old} -> {new}')
+    return regressions
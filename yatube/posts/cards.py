@@ -0,0 +1,112 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .feed import touch_post_feeds
+from .models import Group, Post, User
+
+CARD_TEMPLATE: str = 'posts/includes/post_card.html'
+# Поля автора и группы, которые выводятся в карточке
+USER_CARD_FIELDS = frozenset(('username', 'first_name', 'last_name'))
+GROUP_CARD_FIELDS = frozenset(('slug', 'title'))
+
+
+def card_key(post, show_author=True):
+    """Ключ карточки: id и версия поста. После изменения поста версия
+    растёт, и старая карточка просто перестаёт читаться"""
+
+    return f'post_card:{post.pk}:{post.version}:{int(show_author)}'
+
+
+def render_card(post, show_author=True):
+    """HTML карточки поста для лент. Готовые карточки берутся из кэша,
+    поэтому страница ленты в основном собирается из готовых кусков"""
+
+    key = card_key(post, show_author)
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string(CARD_TEMPLATE, {
+            'post': post,
+            'show_author': show_author,
+        })
+        cache.set(key, html, settings.POST_CARD_CACHE_TIME)
+    return html
+
+
+def bump_versions(posts):
+    posts.update(version=F('version') + 1, updated_at=timezone.now())
+    touch_post_feeds(posts.values('pk'))
+
+
+@receiver(pre_save, sender=Post)
+def bump_post_version(sender, instance, raw=False, update_fields=None,
+                      **kwargs):
+    """Хендлер, который увеличивает версию поста при редактировании.
+    Версия увеличивается в самом UPDATE, чтобы не потерять увеличения,
+    сделанные параллельно, например при добавлении комментария"""
+
+    if raw or instance._state.adding:
+        return
+    if update_fields is None or 'version' in update_fields:
+        instance.version = F('version') + 1
+
+
+@receiver(post_save, sender=Post)
+def load_post_version(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw and not isinstance(instance.version, int):
+        instance.refresh_from_db(fields=('version',))
+
+
+def remember_card_change(model, instance, fields, update_fields):
+    """Запоминаем, изменились ли выводимые в карточке поля: сохранение
+    без update_fields, например смена пароля, не должно сбрасывать
+    карточки всех постов"""
+
+    instance.card_changed = False
+    if instance._state.adding:
+        return
+    if update_fields is not None:
+        fields = fields & set(update_fields)
+    if not fields:
+        return
+    old = model.objects.filter(pk=instance.pk).values(*fields).first()
+    instance.card_changed = old is None or any(
+        old[field] != getattr(instance, field) for field in fields)
+
+
+@receiver(pre_save, sender=User)
+def remember_author_card(sender, instance, raw=False, update_fields=None,
+                         **kwargs):
+    if not raw:
+        remember_card_change(User, instance, USER_CARD_FIELDS,
+                             update_fields)
+
+
+@receiver(pre_save, sender=Group)
+def remember_group_card(sender, instance, raw=False, update_fields=None,
+                        **kwargs):
+    if not raw:
+        remember_card_change(Group, instance, GROUP_CARD_FIELDS,
+                             update_fields)
+
+
+@receiver(post_save, sender=User)
+def bump_author_posts(sender, instance, created, **kwargs):
+    """Хендлер, который сбрасывает карточки постов автора, когда изменились
+    его имя или username"""
+
+    if not created and getattr(instance, 'card_changed', False):
+        bump_versions(Post.objects.filter(author=instance))
+
+
+@receiver(post_save, sender=Group)
+def bump_group_posts(sender, instance, created, **kwargs):
+    """Хендлер, который сбрасывает карточки постов группы, когда изменились
+    её название или slug"""
+
+    if not created and getattr(instance, 'card_changed', False):
+        bump_versions(Post.objects.filter(group=instance))
@@ -0,0 +1,159 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .feed import FEED_STAMP_KEY, new_stamp
+from .models import Group, Post, User
+
+AUTHOR_STAMP_KEY: str = 'change_stamp:user:{}'
+GROUP_STAMP_KEY: str = 'change_stamp:group:{}'
+# Метка лайков поста и его комментариев, ещё не записанных в базу
+LIKES_STAMP_KEY: str = 'change_stamp:likes:{}'
+
+
+def get_stamp(key):
+    """Метка последнего изменения объекта, которого нет в самой выборке"""
+
+    stamp = cache.get(key)
+    if stamp is None:
+        cache.add(key, new_stamp(), None)
+        stamp = cache.get(key)
+    return stamp
+
+
+def make_etag(request, *parts):
+    """ETag страницы. Страница зависит ещё от пользователя (шапка, кнопки)
+    и CSRF-токена в формах, поэтому они тоже входят в ETag"""
+
+    viewer = (request.user.pk,
+              request.COOKIES.get(settings.CSRF_COOKIE_NAME),
+              request.get_full_path())
+    return hashlib.md5(repr(viewer + parts).encode()).hexdigest()
+
+
+def post_detail_etag(request, post_id):
+    """Одним запросом: дата изменения поста, последнего комментария и
+    автор с группой для меток их изменений"""
+
+    # Без сортировки: first() отсортировал бы сгруппированную строку во
+    # временном B-дереве
+    rows = (Post.objects.filter(pk=post_id)
+            .values('updated_at', 'author_id', 'group_id')
+            .annotate(last_comment=Max('comments__updated_at'))
+            .order_by()[:1])
+    if not rows:
+        return None
+    row = rows[0]
+    return make_etag(
+        request,
+        row['updated_at'],
+        row['last_comment'],
+        get_stamp(AUTHOR_STAMP_KEY.format(row['author_id'])),
+        get_stamp(GROUP_STAMP_KEY.format(row['group_id'])),
+        get_stamp(LIKES_STAMP_KEY.format(post_id)),
+    )
+
+
+def last_change(**lookup):
+    """Дата последнего изменения постов - подзапрос, который читает одну
+    запись индекса (автор или группа, дата изменения)"""
+
+    return Subquery(Post.objects.filter(**lookup)
+                    .order_by('-updated_at').values('updated_at')[:1])
+
+
+def profile_etag(request, username):
+    """Одним запросом: автор и дата последнего изменения его постов. Кнопка
+    подписки зависит от подписок зрителя, их отражает метка его ленты"""
+
+    row = (User.objects.filter(username=username)
+           .values('pk')
+           .annotate(last_post=last_change(author=OuterRef('pk')))
+           .first())
+    if row is None:
+        return None
+    viewer_stamp = None
+    if request.user.is_authenticated:
+        viewer_stamp = get_stamp(FEED_STAMP_KEY.format(request.user.pk))
+    return make_etag(
+        request,
+        row['last_post'],
+        get_stamp(AUTHOR_STAMP_KEY.format(row['pk'])),
+        viewer_stamp,
+    )
+
+
+def group_etag(request, slug):
+    """Одним запросом: группа и дата последнего изменения её постов"""
+
+    row = (Group.objects.filter(slug=slug)
+           .values('pk')
+           .annotate(last_post=last_change(group=OuterRef('pk')))
+           .first())
+    if row is None:
+        return None
+    return make_etag(
+        request,
+        row['last_post'],
+        get_stamp(GROUP_STAMP_KEY.format(row['pk'])),
+    )
+
+
+@receiver(post_save, sender=User)
+def touch_author(sender, instance, update_fields=None, **kwargs):
+    """Хендлер, который отмечает изменение пользователя"""
+
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    cache.set(AUTHOR_STAMP_KEY.format(instance.pk), new_stamp(), None)
+
+
+def touch_post_pages(author_id, *group_ids):
+    stamp = new_stamp()
+    keys = [AUTHOR_STAMP_KEY.format(author_id)]
+    keys += [GROUP_STAMP_KEY.format(group_id)
+             for group_id in set(group_ids) if group_id is not None]
+    cache.set_many(dict.fromkeys(keys, stamp), None)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_group(sender, instance, raw=False, **kwargs):
+    """Хендлер, который запоминает прежнюю группу поста: после переноса
+    страница старой группы тоже изменилась, а по датам её постов этого не
+    видно"""
+
+    if raw or instance._state.adding:
+        instance.previous_group_id = None
+        return
+    instance.previous_group_id = (
+        Post.objects.filter(pk=instance.pk)
+        .values_list('group_id', flat=True).first())
+
+
+@receiver(post_save, sender=Post)
+def touch_post_author(sender, instance, raw=False, **kwargs):
+    """Хендлер, который отмечает изменение страниц автора и группы поста,
+    в том числе группы, из которой его перенесли"""
+
+    if not raw:
+        touch_post_pages(instance.author_id, instance.group_id,
+                         getattr(instance, 'previous_group_id', None))
+
+
+@receiver(post_delete, sender=Post)
+def touch_deleted_post(sender, instance, **kwargs):
+    """Хендлер, который отмечает изменение страниц удалённого поста: дата
+    последнего изменения его автора или группы могла не измениться"""
+
+    touch_post_pages(instance.author_id, instance.group_id)
+
+
+@receiver(post_save, sender=Group)
+def touch_group(sender, instance, **kwargs):
+    """Хендлер, который отмечает изменение группы"""
+
+    cache.set(GROUP_STAMP_KEY.format(instance.pk), new_stamp(), None)
@@ -0,0 +1,283 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Celebrity, FeedEntry, Follow, Post
+
+FEED_BATCH_SIZE: int = 500
+CELEBRITIES_CACHE_TIME: int = 300
+# Метки изменений. Своя метка пользователя меняется, когда меняются его
+# подписки, метка автора - когда меняются посты автора в лентах. Лента
+# собирается из меток пользователя и авторов, на которых он подписан,
+# поэтому событие у автора пишет одну метку, а не по метке на подписчика
+FEED_STAMP_KEY: str = 'feed_stamp:{}'
+AUTHOR_FEED_STAMP_KEY: str = 'feed_stamp:author:{}'
+# Общая метка всех лент: меняется после их перестроения
+ALL_FEEDS_STAMP_KEY: str = 'feed_stamp:all'
+# Авторы, на которых подписан пользователь. В ключе его метка, поэтому
+# после подписки или отписки список просто перестаёт читаться
+FOLLOWED_KEY: str = 'feed_followed:{}:{}'
+FOLLOWED_CACHE_TIME: int = 300
+CELEBRITIES_KEY: str = 'feed_celebrities'
+# Готовая страница ленты. Ключ включает ETag, который меняется вместе с
+# метками, поэтому срок жизни - лишь запас на случай их вытеснения из кэша
+FEED_PAGE_CACHE_TIME: int = 60
+
+
+def celebrity_ids():
+    """Авторы в режиме знаменитости (модель Celebrity). Их посты не
+    раскладываются по лентам, а подмешиваются при чтении"""
+
+    celebrities = cache.get(CELEBRITIES_KEY)
+    if celebrities is None:
+        celebrities = set(Celebrity.objects.values_list('author_id',
+                                                        flat=True))
+        cache.set(CELEBRITIES_KEY, celebrities, CELEBRITIES_CACHE_TIME)
+    return celebrities
+
+
+def fill_feeds(condition='', params=()):
+    """Раскладываем по лентам подписчиков посты их авторов одним
+    INSERT ... SELECT. condition ограничивает подписки (псевдоним follow)"""
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT OR IGNORE INTO {FeedEntry._meta.db_table} '
+            '(user_id, post_id, author_id, pub_date) '
+            'SELECT DISTINCT follow.user_id, post.id, post.author_id, '
+            'post.pub_date '
+            f'FROM {Follow._meta.db_table} follow '
+            f'INNER JOIN {Post._meta.db_table} post '
+            'ON post.author_id = follow.author_id '
+            f'{condition}',
+            params
+        )
+
+
+def update_celebrity(author_id):
+    """Переводим автора в режим знаменитости или обратно, когда число его
+    подписчиков пересекает FEED_CELEBRITY_THRESHOLD. Записи лент меняются
+    в той же транзакции: после выхода из режима посты, опубликованные в нём,
+    и подписки, сделанные в нём, должны оказаться в лентах"""
+
+    celebrity = (Follow.objects.filter(author_id=author_id).count()
+                 > settings.FEED_CELEBRITY_THRESHOLD)
+    if celebrity == Celebrity.objects.filter(author_id=author_id).exists():
+        return
+    with transaction.atomic():
+        if celebrity:
+            Celebrity.objects.get_or_create(author_id=author_id)
+            # Записи автора есть только у его подписчиков: так удаление
+            # идёт по индексу (user, author)
+            FeedEntry.objects.filter(
+                user__in=Follow.objects.filter(author_id=author_id)
+                .values('user'),
+                author_id=author_id
+            ).delete()
+        else:
+            Celebrity.objects.filter(author_id=author_id).delete()
+            fill_feeds('WHERE follow.author_id = %s', [author_id])
+    cache.delete(CELEBRITIES_KEY)
+    touch_author_feeds([author_id])
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    """Раскладываем новый пост по лентам всех подписчиков автора"""
+
+    if not created:
+        return
+    touch_author_feeds([instance.author_id])
+    if instance.author_id in celebrity_ids():
+        # Посты знаменитостей подмешиваются при чтении во все ленты
+        return
+    followers = list(Follow.objects.filter(author_id=instance.author_id)
+                     .values_list('user_id', flat=True))
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id,
+                   post=instance,
+                   author_id=instance.author_id,
+                   pub_date=instance.pub_date)
+         for user_id in followers),
+        batch_size=FEED_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+@receiver(post_save, sender=Follow)
+def backfill_feed(sender, instance, created, **kwargs):
+    """После подписки добавляем в ленту все уже опубликованные посты
+    автора"""
+
+    if not created:
+        return
+    touch_feeds([instance.user_id])
+    update_celebrity(instance.author_id)
+    if instance.author_id in celebrity_ids():
+        return
+    posts = (Post.objects.filter(author_id=instance.author_id)
+             .values_list('pk', 'pub_date'))
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=instance.user_id,
+                   post_id=post_id,
+                   author_id=instance.author_id,
+                   pub_date=pub_date)
+         for post_id, pub_date in posts.iterator()),
+        batch_size=FEED_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+@receiver(post_delete, sender=Follow)
+def prune_feed(sender, instance, **kwargs):
+    """После отписки убираем посты автора из ленты"""
+
+    FeedEntry.objects.filter(user_id=instance.user_id,
+                             author_id=instance.author_id).delete()
+    touch_feeds([instance.user_id])
+    update_celebrity(instance.author_id)
+
+
+def new_stamp():
+    """Метка изменения ленты: время в микросекундах. После вытеснения
+    метки из кэша новая метка всё равно больше старой"""
+
+    return time.time_ns() // 1000
+
+
+def touch_feeds(user_ids):
+    """Отмечаем, что подписки этих пользователей изменились"""
+
+    stamp = new_stamp()
+    cache.set_many({FEED_STAMP_KEY.format(user_id): stamp
+                    for user_id in user_ids}, None)
+
+
+def touch_author_feeds(author_ids):
+    """Отмечаем изменение лент, в которых выводятся посты этих авторов:
+    одна метка на автора, сколько бы у него ни было подписчиков"""
+
+    stamp = new_stamp()
+    cache.set_many({AUTHOR_FEED_STAMP_KEY.format(author_id): stamp
+                    for author_id in set(author_ids)}, None)
+
+
+def touch_post_feeds(post_ids):
+    """Отмечаем изменение лент, в которых выводятся эти посты: правка,
+    комментарий, лайк, новые миниатюры"""
+
+    touch_author_feeds(Post.objects.filter(pk__in=post_ids)
+                       .values_list('author_id', flat=True))
+
+
+@receiver(post_save, sender=Post)
+def touch_edited_post(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        touch_author_feeds([instance.author_id])
+
+
+@receiver(post_delete, sender=Post)
+def touch_deleted_post(sender, instance, **kwargs):
+    touch_author_feeds([instance.author_id])
+
+
+def get_stamps(keys):
+    """Метки по ключам. Вытесненная из кэша метка заводится заново"""
+
+    stamps = cache.get_many(keys)
+    for key in keys:
+        if key not in stamps:
+            cache.add(key, new_stamp(), None)
+            stamps[key] = cache.get(key)
+    return tuple(stamps[key] for key in keys)
+
+
+def followed_authors(user_id, user_stamp):
+    key = FOLLOWED_KEY.format(user_id, user_stamp)
+    authors = cache.get(key)
+    if authors is None:
+        authors = sorted(Follow.objects.filter(user_id=user_id)
+                         .values_list('author_id', flat=True))
+        cache.set(key, authors, FOLLOWED_CACHE_TIME)
+    return authors
+
+
+def feed_stamps(user_id):
+    """Метки последних изменений подписок пользователя, всех лент и
+    авторов, на которых он подписан. Список авторов кэшируется, поэтому
+    обычно хватает двух обращений к кэшу"""
+
+    user_stamp, all_stamp = get_stamps((FEED_STAMP_KEY.format(user_id),
+                                        ALL_FEEDS_STAMP_KEY))
+    authors = followed_authors(user_id, user_stamp)
+    return (user_stamp, all_stamp) + get_stamps(
+        [AUTHOR_FEED_STAMP_KEY.format(author_id) for author_id in authors])
+
+
+def feed_etag(request):
+    """ETag страницы ленты: пользователь, метки изменений и параметры
+    страницы. Вычисляется без запросов к базе, пока список подписок
+    пользователя в кэше"""
+
+    params = '&'.join(f'{name}={request.GET.get(name, "")}'
+                      for name in ('page', 'after', 'before'))
+    return hashlib.md5(
+        f'{request.user.pk}:{feed_stamps(request.user.pk)}:'
+        f'{settings.CURSOR_PAGINATION}:{params}'.encode()
+    ).hexdigest()
+
+
+def feed_last_modified(request):
+    return datetime.fromtimestamp(max(feed_stamps(request.user.pk)) / 10**6,
+                                  tz=timezone.utc)
+
+
+def follow_feed(user):
+    """Посты ленты подписок пользователя. Обычно это один запрос по индексу
+    ленты, посты популярных авторов подмешиваются отдельным условием"""
+
+    feed = FeedEntry.objects.filter(user=user)
+    celebrities = celebrity_ids()
+    if celebrities:
+        followed = list(user.follower.filter(author__in=celebrities)
+                        .values_list('author', flat=True))
+        if followed:
+            return Post.objects.filter(
+                Q(pk__in=feed.values('post')) | Q(author__in=followed)
+            )
+    # Дата публикации скопирована в запись ленты: сортировка по ней идёт
+    # по индексу ленты, без сортировки всей выборки
+    return (Post.objects.filter(feed_entries__user=user)
+            .order_by('-feed_entries__pub_date'))
+
+
+def rebuild_feeds():
+    """Перестраиваем все ленты подписок одним INSERT ... SELECT, например
+    после массовой загрузки данных, при которой сигналы не отправляются.
+    Режим знаменитости тоже пересчитывается по текущему порогу"""
+
+    FeedEntry.objects.all().delete()
+    Celebrity.objects.all().delete()
+    Celebrity.objects.bulk_create(
+        Celebrity(author_id=author_id)
+        for author_id in Follow.objects.values('author')
+        .annotate(followers=Count('pk'))
+        .filter(followers__gt=settings.FEED_CELEBRITY_THRESHOLD)
+        .values_list('author', flat=True)
+    )
+    cache.delete(CELEBRITIES_KEY)
+    celebrities = list(celebrity_ids())
+    condition = ''
+    if celebrities:
+        placeholders = ', '.join(['%s'] * len(celebrities))
+        condition = f'WHERE follow.author_id NOT IN ({placeholders})'
+    fill_feeds(condition, celebrities)
+    # Общая метка входит в ключ каждой ленты
+    cache.set(ALL_FEEDS_STAMP_KEY, new_stamp(), None)
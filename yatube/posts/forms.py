@@ -1,12 +1,82 @@
+import shutil
+from concurrent.futures import TimeoutError
+from tempfile import NamedTemporaryFile
+
 from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from PIL import Image
 
 from .models import Post, Comment
+from .uploads import detect_format, reencode_in_worker
+
+
+class BoundedImageField(forms.ImageField):
+    """Поле картинки, которое до полного декодирования проверяет размер
+    файла, сигнатуру формата и разрешение, а затем пересохраняет картинку
+    без EXIF в отдельном процессе"""
+
+    default_error_messages = {
+        **forms.ImageField.default_error_messages,
+        'too_large': 'Файл слишком большой',
+        'too_many_pixels': 'Слишком большое разрешение картинки',
+    }
+
+    def to_python(self, data):
+        if data in self.empty_values:
+            return None
+        if getattr(data, 'too_large', False):
+            raise ValidationError(self.error_messages['too_large'],
+                                  code='too_large')
+        if detect_format(data) is None:
+            raise ValidationError(self.error_messages['invalid_image'],
+                                  code='invalid_image')
+        try:
+            # Image.open читает только заголовок, пиксели не декодируются
+            with Image.open(data) as image:
+                width, height = image.size
+        except (Image.DecompressionBombError, OSError):
+            raise ValidationError(self.error_messages['invalid_image'],
+                                  code='invalid_image')
+        finally:
+            data.seek(0)
+        if width * height > settings.POST_IMAGE_MAX_PIXELS:
+            raise ValidationError(self.error_messages['too_many_pixels'],
+                                  code='too_many_pixels')
+        return super().to_python(self.reencode(data))
+
+    def reencode(self, data):
+        """Пересохраняем картинку в отдельном процессе и записываем результат
+        обратно в загруженный файл"""
+
+        with NamedTemporaryFile() as source, NamedTemporaryFile() as target:
+            if hasattr(data, 'temporary_file_path'):
+                source_path = data.temporary_file_path()
+            else:
+                for chunk in data.chunks():
+                    source.write(chunk)
+                source.flush()
+                source_path = source.name
+            try:
+                reencode_in_worker(source_path, target.name)
+            except (OSError, SyntaxError, ValueError, TimeoutError):
+                raise ValidationError(self.error_messages['invalid_image'],
+                                      code='invalid_image')
+            data.seek(0)
+            data.truncate()
+            shutil.copyfileobj(target, data)
+        data.size = data.tell()
+        data.seek(0)
+        return data
 
 
 class PostForm(forms.ModelForm):
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
+        field_classes = {
+            'image': BoundedImageField,
+        }
 
         labels = {
             'text': 'Текст поста',
@@ -18,4 +88,15 @@ class PostForm(forms.ModelForm):
 class CommentForm(forms.ModelForm):
     class Meta:
         model = Comment
-        fields = ('text',)
+        fields = ('text', 'reply_to')
+        widgets = {
+            'reply_to': forms.HiddenInput,
+        }
+
+    def clean_reply_to(self):
+        reply_to = self.cleaned_data['reply_to']
+        # Отвечать можно только на комментарий того же поста
+        if reply_to is not None and reply_to.post_id != self.instance.post_id:
+            raise ValidationError('Комментарий не найден',
+                                  code='invalid_reply_to')
+        return reply_to
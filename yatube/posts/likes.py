@@ -0,0 +1,314 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .conditional import LIKES_STAMP_KEY
+from .feed import new_stamp, touch_post_feeds
+from .models import Comment, Like, Post
+from .trending import record
+
+logger = logging.getLogger(__name__)
+
+# Изменение счётчика лайков объекта, ещё не записанное в базу. Общее для
+# всех процессов, поэтому видно сразу, а не после сброса буфера. Живые
+# процессы сбрасывают буфер за секунды, поэтому ключ, который не менялся
+# PENDING_TIMEOUT секунд, хранит только изменения упавших процессов и
+# истекает вместе с ними
+PENDING_KEY: str = 'likes_pending:{}:{}'
+PENDING_TIMEOUT: int = 5 * 60
+# Последнее состояние пары (пользователь, тип, id объекта). Тоже общее для
+# всех процессов: по нему повторный лайк, пришедший в другой воркер, не
+# меняет счётчик. Хранится дольше интервала сброса, потом читается из базы
+STATE_KEY: str = 'likes_state:{}:{}:{}'
+STATE_TIMEOUT: int = 60 * 60
+# Блокировка пары на время проверки и смены её состояния
+STATE_LOCK_KEY: str = 'likes_state_lock:{}:{}:{}'
+STATE_LOCK_TIMEOUT: int = 5
+STATE_LOCK_WAIT: float = 0.01
+POST: str = 'post'
+COMMENT: str = 'comment'
+# Сколько пар (пользователь, объект) менять одним UPDATE
+UPDATE_CHUNK: int = 100
+
+
+def pending_key(kind, pk):
+    return PENDING_KEY.format(kind, pk)
+
+
+def state_key(user_id, kind, pk):
+    return STATE_KEY.format(user_id, kind, pk)
+
+
+def states_cache():
+    """Общий уровень кэша в обход L1 процесса: состояния лайков должны
+    читаться такими, какими их записал любой воркер"""
+
+    return getattr(cache, 'shared', cache)
+
+
+@contextmanager
+def state_lock(user_id, kind, pk):
+    """Держим блокировку пары в общем кэше. Если её не отпустили, через
+    STATE_LOCK_TIMEOUT секунд она истекает сама. Не дождались - LikeBusy"""
+
+    store = states_cache()
+    key = STATE_LOCK_KEY.format(user_id, kind, pk)
+    deadline = time.monotonic() + STATE_LOCK_TIMEOUT
+    while not store.add(key, 1, STATE_LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            raise LikeBusy
+        time.sleep(STATE_LOCK_WAIT)
+    try:
+        yield
+    finally:
+        store.delete(key)
+
+
+class LikeBusy(Exception):
+    """Пару (пользователь, объект) сейчас меняет другой запрос"""
+
+
+def add_pending(kind, pk, delta, create=True):
+    """Прибавляем delta к незаписанному изменению счётчика и продлеваем
+    ключ. create=False - только если ключ ещё есть: при сбросе буфера
+    истёкший ключ вычитать не из чего"""
+
+    key = pending_key(kind, pk)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if create and not cache.add(key, delta, PENDING_TIMEOUT):
+            cache.incr(key, delta)
+    else:
+        cache.touch(key, PENDING_TIMEOUT)
+
+
+def likes_count(obj, kind=POST):
+    """Количество лайков вместе с ещё не записанными в базу"""
+
+    return max(obj.likes_count + (cache.get(pending_key(kind, obj.pk)) or 0),
+               0)
+
+
+def mark_likes(user, kind, objects):
+    """Проставляем постам или комментариям likes_total - счётчик вместе с
+    незаписанными лайками - и liked - лайкнул ли их пользователь. Одним
+    запросом к кэшу и одним к базе на всю страницу"""
+
+    objects = list(objects)
+    pending = cache.get_many([pending_key(kind, obj.pk) for obj in objects])
+    liked = set()
+    states = {}
+    if user.is_authenticated and objects:
+        states = states_cache().get_many(
+            [state_key(user.pk, kind, obj.pk) for obj in objects])
+        likes = Like.objects.filter(user=user, like=True)
+        pks = [obj.pk for obj in objects]
+        if kind == POST:
+            likes = likes.filter(post__in=pks, comment__isnull=True)
+            liked = set(likes.values_list('post_id', flat=True))
+        else:
+            liked = set(likes.filter(comment__in=pks)
+                        .values_list('comment_id', flat=True))
+    for obj in objects:
+        obj.likes_total = max(
+            obj.likes_count + pending.get(pending_key(kind, obj.pk), 0), 0)
+        obj.liked = states.get(state_key(user.pk, kind, obj.pk),
+                               obj.pk in liked)
+
+
+class LikeBuffer:
+    """Буфер лайков процесса. Хранит пары (пользователь, объект), изменённые
+    через этот процесс, поэтому серия лайк-снять-лайк превращается в одну
+    запись. Фоновый поток сбрасывает буфер в базу раз в LIKE_FLUSH_INTERVAL
+    секунд или сразу, как только набралось LIKE_FLUSH_BATCH_SIZE пар"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.states = {}
+        self.deltas = Counter()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def put(self, user_id, kind, pk, liked, delta):
+        with self.lock:
+            self.states[(user_id, kind, pk)] = liked
+            self.deltas[(kind, pk)] += delta
+            full = len(self.states) >= settings.LIKE_FLUSH_BATCH_SIZE
+        if full:
+            self.wakeup.set()
+
+    def start(self):
+        """Запускаем фоновый поток сброса, если он ещё не работает"""
+
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self.run, daemon=True,
+                                           name='likes-flusher')
+            self.thread.start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(settings.LIKE_FLUSH_INTERVAL)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Не удалось записать лайки')
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """Записываем накопленные лайки одной транзакцией и убираем их из
+        незаписанных изменений счётчиков"""
+
+        with self.lock:
+            states, self.states = self.states, {}
+            deltas, self.deltas = self.deltas, Counter()
+        if not states:
+            return 0
+        try:
+            write_likes(states)
+        except Exception:
+            # Возвращаем в буфер всё, что не перезаписано новыми лайками
+            with self.lock:
+                for key, liked in states.items():
+                    self.states.setdefault(key, liked)
+                self.deltas.update(deltas)
+            raise
+        for (kind, pk), delta in deltas.items():
+            if delta:
+                add_pending(kind, pk, -delta, create=False)
+        record({pk: settings.TRENDING_WEIGHTS['like'] * delta
+                for (kind, pk), delta in deltas.items() if kind == POST})
+        return len(states)
+
+
+def post_likes():
+    return (Like.objects.filter(post=OuterRef('pk'), like=True,
+                                comment__isnull=True)
+            .order_by().values('post').annotate(total=Count('pk'))
+            .values('total'))
+
+
+def comment_likes():
+    return (Like.objects.filter(comment=OuterRef('pk'), like=True)
+            .order_by().values('comment').annotate(total=Count('pk'))
+            .values('total'))
+
+
+def recount_likes(posts=None, comments=None):
+    """Пересчитываем денормализованные счётчики лайков по базе"""
+
+    if posts is None:
+        posts = Post.objects.all()
+    if comments is None:
+        comments = Comment.objects.all()
+    now = timezone.now()
+    posts.update(likes_count=Coalesce(Subquery(post_likes()), 0),
+                 version=F('version') + 1, updated_at=now)
+    comments.update(likes_count=Coalesce(Subquery(comment_likes()), 0),
+                    updated_at=now)
+
+
+def write_likes(states):
+    """Записываем состояния лайков: новые пары вставляются, у существующих
+    меняется like. Счётчики затронутых постов и комментариев пересчитываются
+    по базе, поэтому повторы и гонки между процессами их не портят"""
+
+    with transaction.atomic():
+        # Состояние пары берём из общего кэша уже внутри транзакции: записи
+        # процессов идут друг за другом, и если пару потом меняли через
+        # другой воркер, последним запишется его состояние
+        latest = states_cache().get_many(
+            [state_key(*pair) for pair in states])
+        states = {pair: latest.get(state_key(*pair), liked)
+                  for pair, liked in states.items()}
+        comment_posts = dict(Comment.objects.filter(pk__in=[
+            pk for (_, kind, pk) in states if kind == COMMENT
+        ]).values_list('pk', 'post_id'))
+        rows = []
+        changes = {True: [], False: []}
+        post_ids, comment_ids = set(), set()
+        for (user_id, kind, pk), liked in states.items():
+            if kind == POST:
+                post_ids.add(pk)
+                target = Q(user_id=user_id, post_id=pk, comment__isnull=True)
+                rows.append(Like(user_id=user_id, post_id=pk, like=liked))
+            elif pk in comment_posts:
+                comment_ids.add(pk)
+                target = Q(user_id=user_id, comment_id=pk)
+                rows.append(Like(user_id=user_id, post_id=comment_posts[pk],
+                                 comment_id=pk, like=liked))
+            else:
+                # Комментарий удалили, пока лайк ждал записи
+                continue
+            changes[liked].append(target)
+        Like.objects.bulk_create(rows, ignore_conflicts=True)
+        for liked, targets in changes.items():
+            # Условия пар склеиваются через OR порциями, чтобы не упереться
+            # в ограничение SQLite на глубину выражения
+            for start in range(0, len(targets), UPDATE_CHUNK):
+                condition = Q()
+                for target in targets[start:start + UPDATE_CHUNK]:
+                    condition |= target
+                Like.objects.filter(condition).exclude(like=liked).update(
+                    like=liked)
+        recount_likes(Post.objects.filter(pk__in=post_ids),
+                      Comment.objects.filter(pk__in=comment_ids))
+    touch_post_feeds(post_ids)
+
+
+buffer = LikeBuffer()
+
+
+def set_like(user, kind, target, liked):
+    """Ставим или снимаем лайк. Повторный запрос с тем же состоянием ничего
+    не меняет. В базу лайк попадёт при следующем сбросе буфера. Если пару
+    параллельно меняет другой запрос и не отпускает, поднимается LikeBusy"""
+
+    store = states_cache()
+    key = state_key(user.pk, kind, target.pk)
+    with state_lock(user.pk, kind, target.pk):
+        current = store.get(key)
+        if current is None:
+            likes = Like.objects.filter(user=user, like=True)
+            if kind == POST:
+                likes = likes.filter(post=target, comment__isnull=True)
+            else:
+                likes = likes.filter(comment=target)
+            current = likes.exists()
+        changed = current != liked
+        if changed:
+            delta = 1 if liked else -1
+            store.set(key, liked, STATE_TIMEOUT)
+            add_pending(kind, target.pk, delta)
+            buffer.put(user.pk, kind, target.pk, liked, delta)
+    if changed:
+        post_id = target.pk if kind == POST else target.post_id
+        cache.set(LIKES_STAMP_KEY.format(post_id), new_stamp(), None)
+        transaction.on_commit(buffer.start)
+    return likes_count(target, kind)
+
+
+def flush_likes():
+    return buffer.flush()
+
+
+@atexit.register
+def flush_on_exit():
+    try:
+        flush_likes()
+    except Exception:
+        logger.exception('Не удалось записать лайки при завершении')
@@ -0,0 +1,151 @@
+import json
+import os
+import platform
+import subprocess
+from io import StringIO
+
+import django
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (setup_test_environment,
+                               teardown_test_environment)
+from django.utils import timezone
+
+from posts.benchmark import (DATASETS, TOLERANCE, benchmark_settings,
+                             compare_results, run_benchmark)
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время, запросы к базе, размер ответа и память вьюх '
+            'posts на сгенерированных данных и сохраняет результат в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--datasets',
+            nargs='+',
+            choices=DATASETS,
+            default=['small', 'medium'],
+            help='Объёмы данных, на которых выполняются замеры'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Сколько раз запрашивать каждую вьюху'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Сколько процессов генерируют данные'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=1,
+            help='Зерно генератора данных'
+        )
+        parser.add_argument(
+            '--output',
+            default=os.path.join(settings.BASE_DIR, 'benchmarks',
+                                 'latest.json'),
+            help='Куда сохранить результаты'
+        )
+        parser.add_argument(
+            '--compare',
+            help='JSON с базовой линией, с которой сравниваются результаты'
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=TOLERANCE,
+            help='Допустимый относительный рост времени и памяти'
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                baseline = json.load(file)['results']
+
+        results = self.run(options)
+        self.save(results, options)
+
+        if baseline is not None:
+            regressions = compare_results(baseline, results,
+                                          options['tolerance'])
+            if regressions:
+                raise CommandError('Регрессии:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('Регрессий нет'))
+
+    def run(self, options):
+        """Замеры выполняются в отдельной тестовой базе и со своим кешем,
+        рабочие база и кеш не меняются"""
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        results = {}
+        try:
+            for dataset in options['datasets']:
+                with benchmark_settings():
+                    call_command('flush', interactive=False, verbosity=0)
+                    call_command('seed', **DATASETS[dataset],
+                                 seed=options['seed'],
+                                 workers=options['workers'],
+                                 stdout=StringIO())
+                    results[dataset] = run_benchmark(options['repeat'])
+                self.report(dataset, results[dataset])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        return results
+
+    def report(self, dataset, results):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'{dataset}: {DATASETS[dataset]}'))
+        self.stdout.write(f'{"view":<14}{"cold":>9}{"p50":>9}{"p90":>9}'
+                          f'{"p99":>9}{"queries":>9}{"KB":>8}{"mem KB":>8}')
+        for view, result in results.items():
+            latency = result['latency_ms']
+            self.stdout.write(
+                f'{view:<14}{result["cold_ms"]:>9.1f}{latency["p50"]:>9.1f}'
+                f'{latency["p90"]:>9.1f}{latency["p99"]:>9.1f}'
+                f'{result["queries"]["warm"]:>9}'
+                f'{result["bytes"] // 1024:>8}{result["peak_memory_kb"]:>8}'
+            )
+
+    def save(self, results, options):
+        data = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'commit': current_commit(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'repeat': options['repeat'],
+                'seed': options['seed'],
+                'datasets': {name: DATASETS[name]
+                             for name in options['datasets']},
+            },
+            'results': results,
+        }
+        os.makedirs(os.path.dirname(options['output']) or '.', exist_ok=True)
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False, indent=2)
+        self.stdout.write(f'Результаты сохранены в {options["output"]}')
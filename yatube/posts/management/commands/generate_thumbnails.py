@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Готовит миниатюры для постов с картинками'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать миниатюры и у постов, где они уже есть'
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='')
+        if not options['all']:
+            posts = posts.filter(thumbnails='')
+        post_ids = list(posts.values_list('pk', flat=True))
+        for post_id in post_ids:
+            generate_thumbnails(post_id)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано постов: {len(post_ids)}'
+        ))
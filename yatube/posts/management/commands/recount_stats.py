@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import User
+from posts.stats import recount_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики авторов и исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько авторов пересчитывать за один запрос'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        user_ids = list(User.objects.order_by('pk')
+                        .values_list('pk', flat=True))
+        fixed = 0
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            fixed += recount_stats(User.objects.filter(pk__in=batch))
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено авторов: {len(user_ids)}, исправлено: {fixed}'
+        ))
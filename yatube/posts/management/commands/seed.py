@@ -0,0 +1,266 @@
+import multiprocessing
+import random
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+from mixer.backend.django import Mixer
+
+from posts.feed import rebuild_feeds
+from posts.likes import recount_likes
+from posts.models import Comment, Follow, Group, Like, Post, User
+from posts.search import fts_available, rebuild_index
+from posts.seeding import LOCALE, fake_rows, power_law_weights
+from posts.stats import recount_post_comments
+from posts.threads import rebuild_paths
+from posts.trending import rebuild_trending
+from posts.utils import bump_generation
+
+# Показатели степенного распределения: чем меньше, тем сильнее перекос
+AUTHOR_ALPHA: float = 1.2
+POPULARITY_ALPHA: float = 1.1
+# Доля постов, привязанных к группе
+GROUP_SHARE: float = 0.6
+
+
+@contextmanager
+def explicit_dates(*models):
+    """Отключаем auto_now_add у pub_date, чтобы bulk_create сохранил даты,
+    разнесённые по времени"""
+
+    fields = [model._meta.get_field('pub_date') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу большим объёмом тестовых данных со степенным '
+            'распределением активности для нагрузочных замеров')
+
+    def add_arguments(self, parser):
+        volumes = (
+            ('users', 1000, 'Количество пользователей'),
+            ('groups', 20, 'Количество групп'),
+            ('posts', 10000, 'Количество постов'),
+            ('comments', 30000, 'Количество комментариев'),
+            ('follows', 20000, 'Количество подписок'),
+            ('likes', 50000, 'Количество лайков'),
+        )
+        for name, default, help_text in volumes:
+            parser.add_argument(f'--{name}', type=int, default=default,
+                                help=help_text)
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Сколько строк генерировать и записывать одной порцией'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=multiprocessing.cpu_count(),
+            help='Сколько процессов генерируют тексты'
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=365,
+            help='За сколько последних дней распределить публикации'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=None,
+            help='Зерно генератора для воспроизводимых данных'
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.span = timedelta(days=options['days']).total_seconds()
+        self.token = uuid.UUID(int=self.rng.getrandbits(128)).hex[:8]
+
+        pool = None
+        if options['workers'] > 1:
+            pool = multiprocessing.get_context('spawn').Pool(
+                options['workers'])
+        self.map = pool.imap if pool else map
+        try:
+            with explicit_dates(Post, Comment):
+                users = self.seed_users(options['users'])
+                groups = self.seed_groups(options['groups'])
+                posts = self.seed_posts(options['posts'], users, groups)
+                comments = self.seed_comments(options['comments'], users,
+                                              posts)
+                self.seed_follows(options['follows'], users)
+                self.seed_likes(options['likes'], users, posts, comments)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        self.rebuild_derived_data()
+
+    def generate(self, kind, total):
+        """Порции сгенерированных строк по batch_size штук. Тексты готовят
+        процессы-воркеры, в базу пишет основной процесс"""
+
+        tasks = [
+            (kind, min(self.batch_size, total - start),
+             self.rng.getrandbits(32))
+            for start in range(0, total, self.batch_size)
+        ]
+        return self.map(fake_rows, tasks)
+
+    def random_date(self, since=None):
+        if since is None:
+            return self.now - timedelta(seconds=self.rng.random() * self.span)
+        return since + (self.now - since) * self.rng.random()
+
+    def report(self, model, count):
+        self.stdout.write(f'{model._meta.verbose_name_plural}: {count}')
+
+    def seed_users(self, total):
+        last_pk = User.objects.aggregate(Max('pk'))['pk__max'] or 0
+        password = make_password(None)
+        created = 0
+        for rows in self.generate('user', total):
+            User.objects.bulk_create([
+                User(username=f'{username}_{self.token}_{created + i}',
+                     first_name=first_name[:30],
+                     last_name=last_name,
+                     password=password)
+                for i, (username, first_name, last_name) in enumerate(rows)
+            ])
+            created += len(rows)
+        self.report(User, created)
+        return list(User.objects.filter(pk__gt=last_pk)
+                    .values_list('pk', flat=True))
+
+    def seed_groups(self, total):
+        last_pk = Group.objects.aggregate(Max('pk'))['pk__max'] or 0
+        mixer = Mixer(commit=False, locale=LOCALE)
+        groups = mixer.cycle(total).blend(
+            Group,
+            slug=mixer.sequence(lambda number: f'{self.token}-{number}')
+        ) if total else []
+        Group.objects.bulk_create(groups)
+        self.report(Group, len(groups))
+        return list(Group.objects.filter(pk__gt=last_pk)
+                    .values_list('pk', flat=True))
+
+    def seed_posts(self, total, users, groups):
+        last_pk = Post.objects.aggregate(Max('pk'))['pk__max'] or 0
+        authors = power_law_weights(len(users), AUTHOR_ALPHA, self.rng)
+        group_weights = power_law_weights(len(groups), POPULARITY_ALPHA,
+                                          self.rng)
+        created = 0
+        for texts in self.generate('post', total):
+            author_ids = self.rng.choices(users, cum_weights=authors,
+                                          k=len(texts))
+            Post.objects.bulk_create([
+                Post(text=text,
+                     author_id=author_id,
+                     group_id=(self.rng.choices(groups,
+                                                cum_weights=group_weights)[0]
+                               if groups and self.rng.random() < GROUP_SHARE
+                               else None),
+                     pub_date=self.random_date())
+                for text, author_id in zip(texts, author_ids)
+            ])
+            created += len(texts)
+        self.report(Post, created)
+        return list(Post.objects.filter(pk__gt=last_pk)
+                    .values_list('pk', 'pub_date'))
+
+    def seed_comments(self, total, users, posts):
+        last_pk = Comment.objects.aggregate(Max('pk'))['pk__max'] or 0
+        authors = power_law_weights(len(users), AUTHOR_ALPHA, self.rng)
+        popularity = power_law_weights(len(posts), POPULARITY_ALPHA, self.rng)
+        created = 0
+        for texts in self.generate('comment', total):
+            targets = self.rng.choices(posts, cum_weights=popularity,
+                                       k=len(texts))
+            author_ids = self.rng.choices(users, cum_weights=authors,
+                                          k=len(texts))
+            Comment.objects.bulk_create([
+                Comment(text=text,
+                        post_id=post_id,
+                        author_id=author_id,
+                        pub_date=self.random_date(since=post_date))
+                for text, (post_id, post_date), author_id
+                in zip(texts, targets, author_ids)
+            ])
+            created += len(texts)
+        self.report(Comment, created)
+        return list(Comment.objects.filter(pk__gt=last_pk)
+                    .values_list('pk', 'post_id'))
+
+    def seed_follows(self, total, users):
+        if len(users) < 2:
+            return
+        popularity = power_law_weights(len(users), POPULARITY_ALPHA, self.rng)
+        pairs = set()
+        attempts = 0
+        while len(pairs) < total and attempts < total * 10:
+            attempts += 1
+            user_id = self.rng.choice(users)
+            author_id = self.rng.choices(users, cum_weights=popularity)[0]
+            if user_id != author_id:
+                pairs.add((user_id, author_id))
+        Follow.objects.bulk_create(
+            (Follow(user_id=user_id, author_id=author_id)
+             for user_id, author_id in pairs),
+            ignore_conflicts=True
+        )
+        self.report(Follow, len(pairs))
+
+    def seed_likes(self, total, users, posts, comments):
+        """Половина лайков достаётся постам, половина - комментариям.
+        Повторные пары (пользователь, объект) отбрасываются уникальными
+        ограничениями"""
+
+        if not users or not posts:
+            return
+        before = Like.objects.count()
+        post_popularity = power_law_weights(len(posts), POPULARITY_ALPHA,
+                                            self.rng)
+        post_targets = self.rng.choices(posts, cum_weights=post_popularity,
+                                        k=total // 2 if comments else total)
+        likes = [Like(user_id=self.rng.choice(users), post_id=post_id)
+                 for post_id, _ in post_targets]
+        if comments:
+            popularity = power_law_weights(len(comments), POPULARITY_ALPHA,
+                                           self.rng)
+            targets = self.rng.choices(comments, cum_weights=popularity,
+                                       k=total - len(likes))
+            likes.extend(Like(user_id=self.rng.choice(users),
+                              post_id=post_id, comment_id=comment_id)
+                         for comment_id, post_id in targets)
+        Like.objects.bulk_create(likes, ignore_conflicts=True)
+        self.report(Like, Like.objects.count() - before)
+
+    def rebuild_derived_data(self):
+        """bulk_create не отправляет сигналов, поэтому счётчики, ленты и
+        поисковый индекс пересобираем целиком, а кэш лент сбрасываем"""
+
+        recount_post_comments()
+        rebuild_paths()
+        recount_likes()
+        rebuild_trending()
+        call_command('recount_stats', stdout=self.stdout)
+        rebuild_feeds()
+        if fts_available():
+            rebuild_index(Post.objects.all())
+        bump_generation(sender=Post)
+        self.stdout.write(self.style.SUCCESS('Готово'))
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_post_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='thumbnails',
+            field=models.TextField(blank=True, editable=False, help_text='Адреса готовых миниатюр картинки в формате JSON', verbose_name='Миниатюры'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:44
+
+from django.db import migrations, models
+from django.db.models import CharField, Count, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Concat, LPad
+import django.db.models.deletion
+
+# Копия posts.threads на момент миграции: код приложения потом меняется
+PATH_STEP = 10
+
+
+def build_paths(apps, schema_editor):
+    Comment = apps.get_model('posts', 'Comment')
+    segment = LPad(Cast('pk', CharField()), PATH_STEP, Value('0'))
+    Comment.objects.filter(reply_to__isnull=True).update(path=segment)
+    parent = Comment.objects.filter(pk=OuterRef('reply_to'))
+    while Comment.objects.filter(path='').exclude(
+            reply_to__path='').update(
+        path=Concat(Subquery(parent.values('path')), segment),
+        depth=Subquery(parent.values('depth')) + 1
+    ):
+        pass
+    replies = (Comment.objects.filter(reply_to=OuterRef('pk')).order_by()
+               .values('reply_to').annotate(total=Count('pk'))
+               .values('total'))
+    Comment.objects.update(replies_count=Coalesce(Subquery(replies), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_comment_reply_to'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='comment_post_pub_date_idx',
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Глубина'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=255, verbose_name='Путь в ветке'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='replies_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество ответов'),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='reply_to',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='posts.Comment', verbose_name='Ответ на комментарий'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+        ),
+        migrations.RunPython(build_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def delete_anonymous_likes(apps, schema_editor):
+    # У старых лайков нет пользователя, их нельзя сделать идемпотентными
+    apps.get_model('posts', 'Like').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0020_comment_threads'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_anonymous_likes,
+                             migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='comment',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество лайков'),
+        ),
+        migrations.AddField(
+            model_name='like',
+            name='user',
+            field=models.ForeignKey(default=None, on_delete=django.db.models.deletion.CASCADE, related_name='likes', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество лайков'),
+        ),
+        migrations.AlterField(
+            model_name='like',
+            name='comment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='like', to='posts.Comment', verbose_name='Комментарий'),
+        ),
+        migrations.AlterField(
+            model_name='like',
+            name='like',
+            field=models.BooleanField(default=True, help_text='Если хотите - поставьте лайк', verbose_name='Лайк'),
+        ),
+        migrations.AddConstraint(
+            model_name='like',
+            constraint=models.UniqueConstraint(condition=models.Q(comment__isnull=True), fields=('user', 'post'), name='unique_post_like'),
+        ),
+        migrations.AddConstraint(
+            model_name='like',
+            constraint=models.UniqueConstraint(fields=('user', 'comment'), name='unique_comment_like'),
+        ),
+    ]
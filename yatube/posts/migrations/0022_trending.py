@@ -0,0 +1,65 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:55
+
+import math
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Копия posts.trending на момент миграции: код приложения потом меняется
+BULK_BATCH_SIZE = 500
+
+
+def event_score(weight, when):
+    half_life = settings.TRENDING_HALF_LIFE * 3600
+    return math.log2(weight) + when.timestamp() / half_life
+
+
+def add_score(score, weight, when):
+    if not weight:
+        return score
+    event = event_score(weight, when)
+    high, low = max(score, event), min(score, event)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def build_scores(apps, schema_editor):
+    # Лайки считаются поставленными в момент публикации поста
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    weights = settings.TRENDING_WEIGHTS
+    scores = {}
+    for pk, pub_date, likes in Post.objects.values_list(
+            'pk', 'pub_date', 'likes_count').iterator():
+        scores[pk] = add_score(event_score(weights['post'], pub_date),
+                               weights['like'] * likes, pub_date)
+    for post_id, pub_date in Comment.objects.values_list(
+            'post_id', 'pub_date').iterator():
+        scores[post_id] = add_score(scores[post_id], weights['comment'],
+                                    pub_date)
+    Post.objects.bulk_update(
+        [Post(pk=pk, trending_score=score) for pk, score in scores.items()],
+        ('trending_score',), batch_size=BULK_BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_likes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False, help_text='Двоичный логарифм суммы весов событий поста, приведённой к началу эпохи', verbose_name='Рейтинг популярности'),
+        ),
+        migrations.RunPython(build_scores, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-trending_score', '-id'], name='post_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-trending_score', '-id'], name='post_group_trending_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:07
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def mark_celebrities(apps, schema_editor):
+    # Ленты уже построены по текущему числу подписчиков: записываем тех же
+    # авторов, которых раньше считали знаменитостями на лету
+    Follow = apps.get_model('posts', 'Follow')
+    Celebrity = apps.get_model('posts', 'Celebrity')
+    Celebrity.objects.bulk_create(
+        Celebrity(author_id=author_id)
+        for author_id in Follow.objects.values('author')
+        .annotate(followers=Count('pk'))
+        .filter(followers__gt=settings.FEED_CELEBRITY_THRESHOLD)
+        .values_list('author', flat=True)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0022_trending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Celebrity',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='celebrity', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'Популярный автор',
+                'verbose_name_plural': 'Популярные авторы',
+            },
+        ),
+        migrations.RunPython(mark_celebrities, migrations.RunPython.noop),
+    ]
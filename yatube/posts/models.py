@@ -1,3 +1,6 @@
+import json
+
+from django.conf import settings
 from django.db import models
 from django.contrib.auth import get_user_model
 
@@ -26,13 +29,15 @@ class Post(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='posts',
-        verbose_name='Автор'
+        verbose_name='Автор',
+        db_index=False
     )
     group = models.ForeignKey(
         Group,
         on_delete=models.SET_NULL,
         null=True,
         blank=True,
+        db_index=False,
         related_name='posts',
         verbose_name='Группа',
         help_text='Выберите группу, к которой будет относиться пост'
@@ -43,22 +48,106 @@ class Post(models.Model):
         blank=True,
         help_text='Выберите изображение, которое хотите приложить к посту'
     )
+    comments_count = models.PositiveIntegerField(
+        'Количество комментариев',
+        default=0,
+        editable=False
+    )
+    likes_count = models.PositiveIntegerField(
+        'Количество лайков',
+        default=0,
+        editable=False
+    )
+    thumbnails = models.TextField(
+        'Миниатюры',
+        blank=True,
+        editable=False,
+        help_text='Адреса готовых миниатюр картинки в формате JSON'
+    )
+    image_variants = models.TextField(
+        'Варианты картинки',
+        blank=True,
+        editable=False,
+        help_text='Адреса картинки разной ширины по форматам в формате JSON'
+    )
+    version = models.PositiveIntegerField(
+        'Версия',
+        default=0,
+        editable=False,
+        help_text='Растёт при каждом изменении того, что видно в карточке'
+    )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
+    trending_score = models.FloatField(
+        'Рейтинг популярности',
+        default=0,
+        editable=False,
+        help_text='Двоичный логарифм суммы весов событий поста, '
+                  'приведённой к началу эпохи'
+    )
 
     class Meta():
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(fields=('-pub_date', '-id'),
+                         name='post_pub_date_id_idx'),
+            # Ленты автора и группы: фильтр и сортировка по одному индексу.
+            # Индексы внешних ключей заменяют они же
+            models.Index(fields=('author', '-pub_date', '-id'),
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=('group', '-pub_date', '-id'),
+                         name='post_group_pub_date_idx'),
+            # Популярные посты: первые N читаются по индексу без сортировки
+            models.Index(fields=('-trending_score', '-id'),
+                         name='post_trending_idx'),
+            models.Index(fields=('group', '-trending_score', '-id'),
+                         name='post_group_trending_idx'),
+            # Последнее изменение постов автора и группы для ETag: одно
+            # чтение по индексу вместо прохода по всем постам
+            models.Index(fields=('author', '-updated_at'),
+                         name='post_author_updated_idx'),
+            models.Index(fields=('group', '-updated_at'),
+                         name='post_group_updated_idx'),
+        )
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
     def __str__(self):
         return self.text[:15]
 
+    @property
+    def thumbnail_urls(self):
+        """Адреса миниатюр по названиям размеров. Пока миниатюры не готовы,
+        для всех размеров отдаём исходную картинку"""
+
+        if self.thumbnails:
+            return json.loads(self.thumbnails)
+        if not self.image:
+            return {}
+        return {name: self.image.url for name in settings.POST_THUMBNAIL_SIZES}
+
+    @property
+    def image_sources(self):
+        """Пары (MIME-тип, srcset) готовых вариантов картинки в порядке
+        предпочтения форматов"""
+
+        if not self.image_variants:
+            return []
+        return [
+            (mime, ', '.join(f'{url} {width}w' for width, url in widths))
+            for mime, widths in json.loads(self.image_variants).items()
+        ]
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
         related_name='comments',
-        verbose_name='Пост'
+        verbose_name='Пост',
+        db_index=False
     )
     author = models.ForeignKey(
         User,
@@ -74,6 +163,35 @@ class Comment(models.Model):
         'Дата публикации',
         auto_now_add=True
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
+    reply_to = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='replies',
+        verbose_name='Ответ на комментарий'
+    )
+    # Материализованный путь: id всех предков и самого комментария по
+    # 10 цифр (см. posts.threads). Сортировка по пути выстраивает ветки в
+    # порядке вывода
+    path = models.CharField('Путь в ветке', max_length=255, default='',
+                            editable=False)
+    depth = models.PositiveSmallIntegerField('Глубина', default=0,
+                                             editable=False)
+    replies_count = models.PositiveIntegerField('Количество ответов',
+                                                default=0, editable=False)
+    likes_count = models.PositiveIntegerField('Количество лайков',
+                                              default=0, editable=False)
+
+    class Meta:
+        indexes = (
+            models.Index(fields=('post', 'path'),
+                         name='comment_post_path_idx'),
+        )
 
 
 class Follow(models.Model):
@@ -81,7 +199,8 @@ class Follow(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='follower',
-        verbose_name='Подписчик'
+        verbose_name='Подписчик',
+        db_index=False
     )
     author = models.ForeignKey(
         User,
@@ -90,10 +209,28 @@ class Follow(models.Model):
         verbose_name='Автор'
     )
 
+    class Meta:
+        constraints = (
+            # Индекс ограничения служит и для поиска подписок пользователя
+            models.UniqueConstraint(fields=('user', 'author'),
+                                    name='unique_follow'),
+        )
+
 
 class Like(models.Model):
+    """Лайк пользователя посту (comment пустой) или комментарию. Снятый
+    лайк остаётся строкой с like=False, поэтому повторная запись того же
+    состояния ничего не меняет"""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='likes',
+        verbose_name='Пользователь'
+    )
     like = models.BooleanField(
         'Лайк',
+        default=True,
         help_text='Если хотите - поставьте лайк'
     )
     post = models.ForeignKey(
@@ -106,5 +243,110 @@ class Like(models.Model):
         Comment,
         on_delete=models.CASCADE,
         related_name='like',
-        verbose_name='Комментарий'
+        verbose_name='Комментарий',
+        null=True,
+        blank=True
     )
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'post'),
+                condition=models.Q(comment__isnull=True),
+                name='unique_post_like'
+            ),
+            models.UniqueConstraint(fields=('user', 'comment'),
+                                    name='unique_comment_like'),
+        )
+
+
+class FeedEntry(models.Model):
+    """Запись материализованной ленты подписок: пост автора, на которого
+    подписан пользователь. Заполняется при публикации поста и подписке"""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        db_index=False,
+        related_name='feed',
+        verbose_name='Подписчик'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пост'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        db_index=False,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta():
+        ordering = ('-pub_date',)
+        # На каждый пост пишется запись на подписчика, поэтому индексов
+        # немного. Индексы внешних ключей user и author заменяют эти
+        indexes = (
+            models.Index(fields=('user', '-pub_date'),
+                         name='feed_user_pub_date_idx'),
+            models.Index(fields=('user', 'author'),
+                         name='feed_user_author_idx'),
+        )
+        constraints = (
+            models.UniqueConstraint(fields=('user', 'post'),
+                                    name='unique_feed_entry'),
+        )
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+
+
+class AuthorStats(models.Model):
+    """Денормализованные счётчики автора, чтобы профиль и страница поста не
+    считали COUNT(*) на каждый запрос"""
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Автор'
+    )
+    posts_count = models.PositiveIntegerField('Количество постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0
+    )
+    following_count = models.PositiveIntegerField(
+        'Количество подписок',
+        default=0
+    )
+    comments_count = models.PositiveIntegerField(
+        'Количество комментариев',
+        default=0
+    )
+
+    class Meta():
+        verbose_name = 'Статистика автора'
+        verbose_name_plural = 'Статистика авторов'
+
+
+class Celebrity(models.Model):
+    """Автор, посты которого не раскладываются по лентам подписок, а
+    подмешиваются при чтении. Записи ленты его подписчиков соответствуют
+    этому режиму: при переходе в него удаляются, при выходе - создаются"""
+
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='celebrity',
+        verbose_name='Автор'
+    )
+
+    class Meta():
+        verbose_name = 'Популярный автор'
+        verbose_name_plural = 'Популярные авторы'
@@ -0,0 +1,208 @@
+import re
+
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Post
+
+FTS_TABLE: str = 'posts_post_fts'
+VOWELS: str = 'аеиоуыэюя'
+WORD_RE = re.compile(r'\w+')
+
+_fts_found = False
+
+
+def _endings(*groups):
+    """Окончания стеммера, отсортированные от длинных к коротким. Для
+    окончаний первой группы перед ними должна стоять «а» или «я»"""
+
+    endings = [(ending, after_a) for after_a, words in groups
+               for ending in words.split()]
+    return sorted(endings, key=lambda item: len(item[0]), reverse=True)
+
+
+PERFECTIVE_GERUND = _endings(
+    (True, 'в вши вшись'),
+    (False, 'ив ивши ившись ыв ывши ывшись'),
+)
+ADJECTIVE = _endings(
+    (False, 'ее ие ые ое ими ыми ей ий ый ой ем им ым ом его ого ему ому их '
+            'ых ую юю ая яя ою ею'),
+)
+PARTICIPLE = _endings(
+    (True, 'ем нн вш ющ щ'),
+    (False, 'ивш ывш ующ'),
+)
+REFLEXIVE = _endings((False, 'ся сь'))
+VERB = _endings(
+    (True, 'ла на ете йте ли й л ем н ло но ет ют ны ть ешь нно'),
+    (False, 'ила ыла ена ейте уйте ите или ыли ей уй ил ыл им ым ен ило ыло '
+            'ено ят ует уют ит ыт ены ить ыть ишь ую ю'),
+)
+NOUN = _endings(
+    (False, 'а ев ов ие ье е иями ями ами еи ии и ией ей ой ий й иям ям ием '
+            'ем ам ом о у ах иях ях ы ь ию ью ю ия ья я'),
+)
+SUPERLATIVE = _endings((False, 'ейше ейш'))
+DERIVATIONAL = _endings((False, 'ост ость'))
+
+
+def _cut(word, endings):
+    """Отрезаем самое длинное подходящее окончание. Возвращает None, если
+    окончание не найдено"""
+
+    for ending, after_a in endings:
+        if word.endswith(ending):
+            rest = word[:-len(ending)]
+            if after_a and not rest.endswith(('а', 'я')):
+                return None
+            return rest
+    return None
+
+
+def _region_after(word, start):
+    for i in range(start + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            return i + 1
+    return len(word)
+
+
+def _cut_inflection(tail):
+    """Шаг 1 стеммера: деепричастие, а иначе возвратная частица и
+    окончание прилагательного, глагола или существительного"""
+
+    result = _cut(tail, PERFECTIVE_GERUND)
+    if result is not None:
+        return result
+    reflexive = _cut(tail, REFLEXIVE)
+    if reflexive is not None:
+        tail = reflexive
+    adjective = _cut(tail, ADJECTIVE)
+    if adjective is not None:
+        participle = _cut(adjective, PARTICIPLE)
+        return adjective if participle is None else participle
+    for endings in (VERB, NOUN):
+        result = _cut(tail, endings)
+        if result is not None:
+            return result
+    return tail
+
+
+def stem(word):
+    """Стеммер Портера (Snowball) для русского языка"""
+
+    word = word.lower().replace('ё', 'е')
+    rv = next((i + 1 for i, char in enumerate(word) if char in VOWELS), None)
+    if rv is None:
+        return word
+    r2 = _region_after(word, _region_after(word, 0))
+    tail = _cut_inflection(word[rv:])
+
+    # Шаг 2
+    if tail.endswith('и'):
+        tail = tail[:-1]
+
+    # Шаг 3: словообразовательное окончание в R2
+    derivational = _cut(tail, DERIVATIONAL)
+    if derivational is not None and rv + len(derivational) >= r2:
+        tail = derivational
+
+    # Шаг 4
+    superlative = _cut(tail, SUPERLATIVE)
+    if superlative is not None:
+        tail = superlative
+    if tail.endswith('нн'):
+        tail = tail[:-1]
+    elif superlative is None and tail.endswith('ь'):
+        tail = tail[:-1]
+    return word[:rv] + tail
+
+
+def tokenize(text):
+    """Разбиваем текст на основы слов для поискового индекса"""
+
+    return [stem(word) for word in WORD_RE.findall(text.lower())]
+
+
+def fts_available():
+    """Полнотекстовый индекс есть только в SQLite с поддержкой FTS5"""
+
+    global _fts_found
+    if connection.vendor != 'sqlite':
+        return False
+    if not _fts_found:
+        _fts_found = FTS_TABLE in connection.introspection.table_names()
+    return _fts_found
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    """Хендлер, который обновляет пост в поисковом индексе"""
+
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                       [instance.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE}(rowid, text) VALUES (%s, %s)',
+            [instance.pk, ' '.join(tokenize(instance.text))]
+        )
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    """Хендлер, который удаляет пост из поискового индекса"""
+
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                       [instance.pk])
+
+
+def search_posts(query, post_list=None):
+    """Посты, в которых встречаются все слова запроса, от более
+    релевантных к менее релевантным (BM25). Без FTS5 ищем через LIKE"""
+
+    if post_list is None:
+        post_list = Post.objects.all()
+    terms = tokenize(query)
+    if not terms:
+        return post_list.none()
+    if not fts_available():
+        for word in WORD_RE.findall(query):
+            post_list = post_list.filter(text__icontains=word)
+        return post_list
+    match = ' '.join(f'"{term}"*' for term in terms)
+    return post_list.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = posts_post.id',
+               f'{FTS_TABLE} MATCH %s'],
+        params=[match],
+        select={'rank': f'bm25({FTS_TABLE})'},
+    ).order_by('rank')
+
+
+def rebuild_index(post_list, batch_size=1000):
+    """Перестраиваем поисковый индекс целиком, например после bulk_create,
+    который не отправляет сигналов"""
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        rows = post_list.order_by().values_list('pk', 'text')
+        batch = []
+        for pk, text in rows.iterator():
+            batch.append((pk, ' '.join(tokenize(text))))
+            if len(batch) == batch_size:
+                cursor.executemany(
+                    f'INSERT INTO {FTS_TABLE}(rowid, text) VALUES (%s, %s)',
+                    batch
+                )
+                batch = []
+        if batch:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE}(rowid, text) VALUES (%s, %s)',
+                batch
+            )
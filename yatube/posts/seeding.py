@@ -0,0 +1,33 @@
+# Генерация тестовых данных для команды seed. Модуль не импортирует Django,
+# поэтому его функции выполняются в процессах-воркерах без настройки проекта
+from itertools import accumulate
+
+from faker import Faker
+
+LOCALE: str = 'ru_RU'
+
+
+def power_law_weights(count, alpha, rng):
+    """Накопленные веса со степенным (Парето) распределением: небольшая
+    часть объектов получает большую часть активности"""
+
+    return list(accumulate(rng.paretovariate(alpha) for _ in range(count)))
+
+
+def fake_rows(task):
+    """Генерирует порцию строк в процессе-воркере.
+    task = (вид данных, количество, зерно генератора)"""
+
+    kind, count, seed = task
+    fake = Faker(LOCALE)
+    fake.seed_instance(seed)
+    if kind == 'user':
+        return [(fake.user_name(), fake.first_name(), fake.last_name())
+                for _ in range(count)]
+    if kind == 'post':
+        return [fake.paragraph(nb_sentences=fake.random_int(1, 8))
+                for _ in range(count)]
+    if kind == 'comment':
+        return [fake.sentence(nb_words=fake.random_int(3, 20))
+                for _ in range(count)]
+    raise ValueError(f'Неизвестный вид данных: {kind}')
@@ -0,0 +1,79 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import AuthorStats, Comment, Follow, Post, User
+
+# Счётчик и модель с полем, по которому он считается
+STATS_FIELDS = {
+    'posts_count': (Post, 'author'),
+    'followers_count': (Follow, 'author'),
+    'following_count': (Follow, 'user'),
+    'comments_count': (Comment, 'author'),
+}
+
+
+def actual_stats(users):
+    """Реальные значения счётчиков для набора пользователей, посчитанные
+    одним запросом с подзапросами"""
+
+    annotations = {}
+    for name, (model, field) in STATS_FIELDS.items():
+        total = (model.objects.filter(**{field: OuterRef('pk')}).order_by()
+                 .values(field).annotate(total=Count('pk')).values('total'))
+        annotations[name] = Coalesce(Subquery(total), 0)
+    return users.annotate(**annotations).values('pk', *STATS_FIELDS)
+
+
+def recount_stats(users):
+    """Пересчитываем счётчики авторов и исправляем расхождения. Возвращает
+    количество созданных или исправленных записей"""
+
+    existing = AuthorStats.objects.in_bulk(users.values_list('pk', flat=True))
+    to_create, to_update = [], []
+    for row in actual_stats(users):
+        stats = AuthorStats(user_id=row.pop('pk'), **row)
+        current = existing.get(stats.user_id)
+        if current is None:
+            to_create.append(stats)
+        elif any(getattr(current, name) != getattr(stats, name)
+                 for name in STATS_FIELDS):
+            to_update.append(stats)
+    AuthorStats.objects.bulk_create(to_create, ignore_conflicts=True)
+    AuthorStats.objects.bulk_update(to_update, list(STATS_FIELDS))
+    return len(to_create) + len(to_update)
+
+
+def get_author_stats(author):
+    """Счётчики автора. Если записи ещё нет - считаем их по базе, но не
+    сохраняем: вьюхи, которые это вызывают, читают с реплики и не должны
+    писать. Запись появится при первом изменении счётчиков (update_stats)
+    или после recount_stats"""
+
+    try:
+        return author.stats
+    except AuthorStats.DoesNotExist:
+        row = actual_stats(User.objects.filter(pk=author.pk)).get()
+        return AuthorStats(user_id=row.pop('pk'), **row)
+
+
+def update_stats(user, **deltas):
+    """Атомарно меняем счётчики автора, например update_stats(user, posts=1).
+    Вызывается в той же транзакции, что и изменение данных"""
+
+    changes = {
+        f'{name}_count': Greatest(F(f'{name}_count') + delta, 0)
+        for name, delta in deltas.items()
+    }
+    if not AuthorStats.objects.filter(user=user).update(**changes):
+        # Записи ещё нет: считаем её целиком, изменение уже в базе
+        recount_stats(User.objects.filter(pk=user.pk))
+
+
+def recount_post_comments(posts=None):
+    """Пересчитываем денормализованное количество комментариев постов"""
+
+    if posts is None:
+        posts = Post.objects.all()
+    total = (Comment.objects.filter(post=OuterRef('pk')).order_by()
+             .values('post').annotate(total=Count('pk')).values('total'))
+    return posts.update(comments_count=Coalesce(Subquery(total), 0))
@@ -0,0 +1,13 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from ..cards import render_card
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_card(post, show_author=True):
+    """Выводит карточку поста для лент из кэша фрагментов"""
+
+    return mark_safe(render_card(post, show_author))
@@ -0,0 +1,17 @@
+from django import template
+
+register = template.Library()
+
+DEFAULT_SIZES: str = '(min-width: 1200px) 960px, 100vw'
+
+
+@register.inclusion_tag('posts/includes/post_image.html')
+def post_image(post, sizes=DEFAULT_SIZES):
+    """Выводит картинку поста тегом <picture> с srcset готовых вариантов
+    и миниатюрой в качестве запасного варианта"""
+
+    return {
+        'post': post,
+        'sources': post.image_sources,
+        'sizes': sizes,
+    }
@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import time
+
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from core.asgi import ASGIHandler
+
+
+def echo_application(environ, start_response):
+    body = environ['wsgi.input'].read()
+    start_response('200 OK', [('Content-Type', 'text/plain'),
+                              ('X-Thread', threading.current_thread().name)])
+    return [environ['PATH_INFO'].encode('latin-1'), b':', body]
+
+
+class StreamingResult:
+    """Потоковый ответ, который запоминает, в каком потоке его закрыли"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed_in = None
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        self.closed_in = threading.current_thread().name
+
+
+async def call(application, path, chunks=(b'',), delay=0, method='GET',
+               headers=()):
+    """Запрос к ASGI-приложению от клиента, который присылает тело
+    кусками с паузой delay между ними"""
+
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': b'',
+        'headers': [(b'host', b'testserver'), *headers],
+    }
+    chunks = list(chunks)
+    messages = []
+
+    async def receive():
+        await asyncio.sleep(delay)
+        chunk = chunks.pop(0)
+        return {'type': 'http.request', 'body': chunk,
+                'more_body': bool(chunks)}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    start, *bodies = messages
+    return (start['status'], dict(start['headers']),
+            b''.join(body['body'] for body in bodies))
+
+
+class ASGIHandlerTest(SimpleTestCase):
+    def test_django_request(self):
+        """Запрос проходит через Django и возвращает страницу"""
+
+        status, headers, body = asyncio.run(
+            call(ASGIHandler(), reverse('about:author')))
+
+        self.assertEqual(status, 200)
+        self.assertIn(b'text/html', headers[b'content-type'])
+        self.assertIn(b'<html', body)
+
+    def test_slow_clients_do_not_hold_threads(self):
+        """Один поток обслуживает много медленных клиентов одновременно:
+        пока тело запроса приходит, поток свободен"""
+
+        application = ASGIHandler(echo_application, max_workers=1)
+        clients = 20
+        delay = 0.05
+
+        async def main():
+            return await asyncio.gather(*(
+                call(application, f'/пост/{number}/',
+                     chunks=(b'a', b'b', b'c'), delay=delay, method='POST')
+                for number in range(clients)
+            ))
+
+        started = time.monotonic()
+        responses = asyncio.run(main())
+        elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, clients * delay)
+        self.assertEqual(len({headers[b'x-thread']
+                              for _, headers, _ in responses}), 1)
+        for number, (status, _, body) in enumerate(responses):
+            self.assertEqual(status, 200)
+            self.assertEqual(body.decode('utf-8'), f'/пост/{number}/:abc')
+
+    @override_settings(ASGI_MAX_BODY_SIZE=4)
+    def test_body_too_large(self):
+        """Тело больше предела отклоняется с кодом 413 и до приложения не
+        доходит: и по Content-Length, и по прочитанному"""
+
+        application = ASGIHandler(echo_application, max_workers=1)
+        for headers, chunks in (
+            ([(b'content-length', b'6')], (b'abcdef',)),
+            ([], (b'abc', b'def')),
+        ):
+            with self.subTest(headers=headers):
+                status, _, _ = asyncio.run(call(
+                    application, '/', chunks=chunks, method='POST',
+                    headers=headers))
+                self.assertEqual(status, 413)
+        status, _, body = asyncio.run(call(
+            application, '/', chunks=(b'ab', b'cd'), method='POST'))
+        self.assertEqual((status, body), (200, b'/:abcd'))
+
+    def test_streaming_response(self):
+        """Куски потокового ответа уходят клиенту отдельными сообщениями, а
+        закрывается ответ в рабочем потоке"""
+
+        result = StreamingResult([b'first', b'', b'second'])
+
+        def application(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return result
+
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(ASGIHandler(application, max_workers=1)(
+            {'type': 'http', 'method': 'GET', 'path': '/'}, receive, send))
+
+        self.assertEqual(messages[0]['type'], 'http.response.start')
+        self.assertEqual(
+            [(message['body'], message.get('more_body', False))
+             for message in messages[1:]],
+            [(b'first', True), (b'second', True), (b'', False)])
+        self.assertTrue(result.closed_in.startswith('asgi'))
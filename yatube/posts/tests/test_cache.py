@@ -0,0 +1,132 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+
+from core.cache import LocalTier, SQLiteCache, TwoTierCache
+
+
+class TwoTierCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        shared = {
+            'BACKEND': 'core.cache.SQLiteCache',
+            'LOCATION': os.path.join(self.directory, 'cache.sqlite3'),
+        }
+        override = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+            },
+            'test_shared': shared,
+        })
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        # Два воркера: общий кеш один, L1 у каждого свой
+        self.first, self.second = (
+            self.worker({'CHECK_INTERVAL': 0}) for _ in range(2))
+
+    def worker(self, options):
+        cache = TwoTierCache('test_shared', {'OPTIONS': options})
+        cache.local = LocalTier(100)
+        return cache
+
+    def test_l1_serves_hot_keys(self):
+        """Прочитанное значение остаётся в L1 и читается без общего кеша"""
+
+        self.first.set('key', {'value': 1})
+        self.assertEqual(self.second.get('key'), {'value': 1})
+        self.second.shared.delete('key')
+
+        self.assertEqual(self.second.get('key'), {'value': 1})
+
+    def test_changes_reach_other_workers(self):
+        """Изменения одного воркера удаляют ключ из L1 других воркеров"""
+
+        self.first.set('key', 'old')
+        self.first.set('untouched', 'value')
+        self.assertEqual(self.second.get('key'), 'old')
+        self.assertEqual(self.second.get('untouched'), 'value')
+
+        self.first.set('key', 'new')
+        self.assertEqual(self.second.get('key'), 'new')
+
+        self.first.add('counter', 1)
+        self.assertEqual(self.second.get('counter'), 1)
+        self.first.incr('counter')
+        self.assertEqual(self.second.get('counter'), 2)
+
+        self.first.delete('key')
+        self.assertIsNone(self.second.get('key'))
+        self.assertEqual(len(self.second.local.entries), 2)
+
+    def test_check_interval(self):
+        """Между проверками счётчика L1 может отдавать устаревшее
+        значение, после проверки - свежее"""
+
+        lazy = self.worker({'CHECK_INTERVAL': 3600})
+        self.first.set('key', 'old')
+        self.assertEqual(lazy.get('key'), 'old')
+        self.first.set('key', 'new')
+
+        self.assertEqual(lazy.get('key'), 'old')
+        lazy.local.checked = float('-inf')
+        self.assertEqual(lazy.get('key'), 'new')
+
+    def test_lost_log_clears_l1(self):
+        """Если журнал изменений недоступен, L1 очищается целиком"""
+
+        self.second.set('key', 'value')
+        self.first.set('other', 'value')
+        self.first.shared.clear()
+
+        self.assertIsNone(self.second.get('key'))
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.cache = SQLiteCache(
+            os.path.join(self.directory, 'cache.sqlite3'), {})
+
+    def test_operations(self):
+        """SQLite-кеш хранит значения, счётчики и время жизни"""
+
+        cache = self.cache
+        cache.set('page', ('rows', [1, 2]))
+        self.assertEqual(cache.get('page'), ('rows', [1, 2]))
+        self.assertFalse(cache.add('page', 'other'))
+        self.assertTrue(cache.add('counter', 10))
+        self.assertEqual(cache.incr('counter', 5), 15)
+        self.assertEqual(cache.decr('counter'), 14)
+        with self.assertRaises(ValueError):
+            cache.incr('missing')
+
+        cache.set('expired', 'value', -1)
+        self.assertIsNone(cache.get('expired'))
+        self.assertTrue(cache.add('expired', 'fresh'))
+        self.assertEqual(cache.get('expired'), 'fresh')
+
+        cache.delete('page')
+        self.assertIsNone(cache.get('page'))
+        cache.clear()
+        self.assertIsNone(cache.get('counter'))
+
+    def test_old_sqlite(self):
+        """Без RETURNING и ON CONFLICT бэкенд не создаётся"""
+
+        with mock.patch('core.cache.sqlite3.sqlite_version_info',
+                        (3, 34, 1)):
+            with self.assertRaises(ImproperlyConfigured):
+                SQLiteCache(os.path.join(self.directory, 'old.sqlite3'), {})
+
+    def test_tests_use_own_cache(self):
+        """Тесты работают со своим общим кешем, а не с файлом dev-сервера"""
+
+        self.assertEqual(caches['shared'].__class__.__name__,
+                         'LocMemCache')
@@ -0,0 +1,121 @@
+import json
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import F, Sum
+from django.test import TestCase
+
+from ..benchmark import compare_results, run_benchmark
+from ..models import (AuthorStats, Comment, FeedEntry, Follow, Group, Like,
+                      Post, User)
+
+
+class RecountStatsTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        Post.objects.bulk_create([
+            Post(text=f'Пост № {i}', author=self.author) for i in range(3)
+        ])
+        Follow.objects.create(user=self.reader, author=self.author)
+        Comment.objects.create(post=Post.objects.first(),
+                               author=self.reader,
+                               text='Комментарий')
+
+    def test_recount_stats(self):
+        """Команда recount_stats создаёт счётчики и исправляет
+        расхождения"""
+
+        call_command('recount_stats', stdout=StringIO())
+        author = AuthorStats.objects.get(user=self.author)
+        reader = AuthorStats.objects.get(user=self.reader)
+
+        self.assertEqual((author.posts_count, author.followers_count),
+                         (3, 1))
+        self.assertEqual((reader.following_count, reader.comments_count),
+                         (1, 1))
+
+        AuthorStats.objects.filter(user=self.author).update(posts_count=100)
+        out = StringIO()
+        call_command('recount_stats', batch_size=1, stdout=out)
+        author.refresh_from_db()
+
+        self.assertEqual(author.posts_count, 3)
+        self.assertIn('исправлено: 1', out.getvalue())
+
+
+class SeedTest(TestCase):
+    def test_seed(self):
+        """Команда seed создаёт данные и пересчитывает производные
+        счётчики и ленты"""
+
+        call_command('seed', users=20, groups=3, posts=60, comments=90,
+                     follows=40, likes=30, batch_size=25, workers=2, seed=1,
+                     stdout=StringIO())
+
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 60)
+        self.assertEqual(Comment.objects.count(), 90)
+        # Повторные лайки той же пары отбрасываются
+        self.assertTrue(0 < Like.objects.count() <= 30)
+        likes = (Post.objects.aggregate(total=Sum('likes_count'))['total']
+                 + Comment.objects.aggregate(
+                     total=Sum('likes_count'))['total'])
+        self.assertEqual(likes, Like.objects.count())
+        self.assertFalse(Follow.objects.filter(user=F('author')).exists())
+        self.assertEqual(
+            Post.objects.aggregate(total=Sum('comments_count'))['total'], 90
+        )
+        self.assertFalse(
+            Comment.objects.filter(pub_date__lt=F('post__pub_date')).exists()
+        )
+        stats = AuthorStats.objects.aggregate(
+            posts=Sum('posts_count'), following=Sum('following_count'))
+        self.assertEqual(stats['posts'], 60)
+        self.assertEqual(stats['following'], Follow.objects.count())
+        expected = Post.objects.filter(
+            author__following__isnull=False).count()
+        self.assertEqual(FeedEntry.objects.count(), expected)
+
+
+class BenchmarkTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(title='Группа', slug='group',
+                                          description='Описание')
+        Post.objects.bulk_create([
+            Post(text=f'Пост № {i}', author=self.author, group=self.group)
+            for i in range(15)
+        ])
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def test_run_benchmark(self):
+        """Бенчмарк замеряет все вьюхи и находит регрессии"""
+
+        cache.set('site_key', 'value')
+        results = run_benchmark(repeat=3)
+
+        # Кеш сайта бенчмарк не очищает
+        self.assertEqual(cache.get('site_key'), 'value')
+        self.assertEqual(set(results), {
+            'index', 'group_posts', 'profile', 'post_detail',
+            'follow_index', 'post_create'
+        })
+        for view, result in results.items():
+            with self.subTest(view=view):
+                expected = [302] if view == 'post_create' else [200]
+                self.assertEqual(result['status'], expected)
+                self.assertGreater(result['queries']['cold'], 0)
+                self.assertGreater(result['peak_memory_kb'], 0)
+                self.assertLessEqual(result['latency_ms']['p50'],
+                                     result['latency_ms']['p99'])
+        self.assertEqual(Post.objects.filter(author=self.reader).count(), 5)
+
+        current = {'small': results}
+        self.assertEqual(compare_results(current, current), [])
+        slower = json.loads(json.dumps(current))
+        slower['small']['index']['queries']['warm'] += 1
+        self.assertEqual(len(compare_results(current, slower)), 1)
@@ -0,0 +1,82 @@
+import copy
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.db import connection
+from django.test import SimpleTestCase
+
+from core.db.sqlite3.base import DatabaseWrapper
+
+
+class SQLiteBackendTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.settings_dict = copy.deepcopy(connection.settings_dict)
+        self.settings_dict['NAME'] = os.path.join(self.directory, 'db.sqlite3')
+        writer = self.connect()
+        with writer.cursor() as cursor:
+            cursor.execute('CREATE TABLE post (text TEXT)')
+            cursor.execute("INSERT INTO post VALUES ('Первый пост')")
+        writer.close()
+
+    def connect(self):
+        wrapper = DatabaseWrapper(copy.deepcopy(self.settings_dict))
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def fetch(self, wrapper, sql):
+        with wrapper.cursor() as cursor:
+            cursor.execute(sql)
+            return cursor.fetchall()
+
+    def test_pragmas(self):
+        """PRAGMA из настроек применяются к каждому соединению"""
+
+        wrapper = self.connect()
+        self.assertEqual(self.fetch(wrapper, 'PRAGMA journal_mode'),
+                         [('wal',)])
+        self.assertEqual(self.fetch(wrapper, 'PRAGMA synchronous'), [(1,)])
+        self.assertEqual(self.fetch(wrapper, 'PRAGMA busy_timeout'),
+                         [(5000,)])
+
+    def test_concurrent_writes(self):
+        """Пока одна транзакция пишет, читатели видят последние
+        закоммиченные данные, а второй писатель дожидается её конца
+        повторами, даже без ожидания внутри SQLite"""
+
+        writer = self.connect()
+        writer.set_autocommit(
+            False, force_begin_transaction_with_broken_autocommit=True)
+        with writer.cursor() as cursor:
+            cursor.execute("INSERT INTO post VALUES ('Второй пост')")
+
+        reader = self.connect()
+        self.assertEqual(self.fetch(reader, 'SELECT COUNT(*) FROM post'),
+                         [(1,)])
+
+        errors = []
+
+        def write():
+            other = DatabaseWrapper(copy.deepcopy(self.settings_dict))
+            other.settings_dict['OPTIONS']['pragmas']['busy_timeout'] = 0
+            try:
+                with other.cursor() as cursor:
+                    cursor.execute("INSERT INTO post VALUES ('Третий пост')")
+            except Exception as error:
+                errors.append(error)
+            finally:
+                other.close()
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        time.sleep(0.1)
+        writer.commit()
+        thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.fetch(reader, 'SELECT COUNT(*) FROM post'),
+                         [(3,)])
@@ -1,7 +1,9 @@
 import shutil
 import tempfile
+from io import BytesIO
 
 from http import HTTPStatus
+from PIL import Image
 from django.test import Client, TestCase, override_settings
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
@@ -127,6 +129,54 @@ class PostsTestForms(TestCase):
         self.assertEqual(post_image.image, 'posts/small.gif')
         self.assertEqual(Post.objects.count(), post_count + 1)
 
+    def post_image(self, content, name='image.jpg'):
+        """Отправляет форму создания поста с картинкой"""
+
+        uploaded = SimpleUploadedFile(name=name, content=content,
+                                      content_type='image/jpeg')
+        return self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с картинкой', 'image': uploaded},
+        )
+
+    def make_jpeg(self, size):
+        buffer = BytesIO()
+        exif = Image.Exif()
+        exif[0x010F] = 'Secret camera'
+        Image.new('RGB', size, 'red').save(buffer, 'JPEG', exif=exif)
+        return buffer.getvalue()
+
+    def test_PostForm_rejects_bad_images(self):
+        """Слишком большие файлы, файлы с чужой сигнатурой и картинки со
+        слишком большим разрешением не сохраняются"""
+
+        post_count = Post.objects.count()
+        cases = {
+            'too_large': (self.make_jpeg((40, 20)),
+                          {'POST_IMAGE_MAX_UPLOAD_SIZE': 10}),
+            'invalid_image': (b'<?php echo "not an image"; ?>', {}),
+            'too_many_pixels': (self.make_jpeg((40, 20)),
+                                {'POST_IMAGE_MAX_PIXELS': 100}),
+        }
+        for code, (content, limits) in cases.items():
+            with self.subTest(code=code), self.settings(**limits):
+                response = self.post_image(content)
+                self.assertTrue(response.context['form'].has_error('image',
+                                                                   code))
+        self.assertEqual(Post.objects.count(), post_count)
+
+    @override_settings(POST_IMAGE_MAX_SIDE=10)
+    def test_PostForm_reencodes_image(self):
+        """Картинка пересохраняется с ограничением разрешения и без
+        EXIF"""
+
+        self.post_image(self.make_jpeg((40, 20)))
+        post = Post.objects.get(text='Пост с картинкой')
+
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (10, 5))
+            self.assertNotIn(0x010F, image.getexif())
+
     def test_comment_in_context(self):
         """Проверка, что после успешной отправки комментарий появляется на
         странице поста"""
@@ -0,0 +1,158 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .. import likes
+from ..models import Comment, Like, Post, User
+
+
+class LikesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(likes, 'buffer', likes.LikeBuffer())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.post = Post.objects.create(text='Пост', author=self.author)
+        self.comment = Comment.objects.create(text='Комментарий',
+                                              post=self.post,
+                                              author=self.author)
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.like_url = reverse('posts:like_post',
+                                kwargs={'post_id': self.post.pk})
+        self.unlike_url = reverse('posts:unlike_post',
+                                  kwargs={'post_id': self.post.pk})
+
+    def like(self, url):
+        return self.client.post(
+            url, HTTP_X_REQUESTED_WITH='XMLHttpRequest').json()
+
+    def test_like_is_idempotent(self):
+        """Повторный лайк и повторное снятие ничего не меняют, счётчик
+        виден до записи в базу"""
+
+        self.assertEqual(self.like(self.like_url),
+                         {'liked': True, 'likes_count': 1})
+        self.assertEqual(self.like(self.like_url),
+                         {'liked': True, 'likes_count': 1})
+        self.assertFalse(Like.objects.exists())
+
+        likes.flush_likes()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertEqual(likes.likes_count(self.post), 1)
+        self.assertEqual(self.like(self.like_url)['likes_count'], 1)
+
+        self.assertEqual(self.like(self.unlike_url),
+                         {'liked': False, 'likes_count': 0})
+        self.assertEqual(self.like(self.unlike_url),
+                         {'liked': False, 'likes_count': 0})
+        likes.flush_likes()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+        self.assertFalse(Like.objects.filter(like=True).exists())
+
+    def test_toggles_are_coalesced(self):
+        """Серия лайков и снятий одной пары пишется в базу один раз"""
+
+        for _ in range(5):
+            self.like(self.like_url)
+            self.like(self.unlike_url)
+        self.like(self.like_url)
+
+        self.assertEqual(likes.flush_likes(), 1)
+        self.assertEqual(Like.objects.get().like, True)
+        self.assertEqual(likes.likes_count(Post.objects.get()), 1)
+        self.assertEqual(likes.flush_likes(), 0)
+
+    def test_workers_share_states(self):
+        """Лайк, повторённый через другой процесс со своим буфером, не
+        считается второй раз, а в базу пишется последнее состояние пары"""
+
+        self.like(self.like_url)
+        first = likes.buffer
+        with mock.patch.object(likes, 'buffer', likes.LikeBuffer()):
+            self.assertEqual(self.like(self.like_url),
+                             {'liked': True, 'likes_count': 1})
+            self.assertEqual(self.like(self.unlike_url),
+                             {'liked': False, 'likes_count': 0})
+            self.assertEqual(likes.flush_likes(), 1)
+        self.assertEqual(first.flush(), 1)
+
+        self.assertEqual(Like.objects.get().like, False)
+        post = Post.objects.get()
+        self.assertEqual(post.likes_count, 0)
+        self.assertEqual(likes.likes_count(post), 0)
+
+    def test_busy_pair(self):
+        """Пока пару держит другой запрос, лайк отклоняется, а чужая
+        блокировка остаётся на месте"""
+
+        lock_key = likes.STATE_LOCK_KEY.format(self.reader.pk, likes.POST,
+                                               self.post.pk)
+        likes.states_cache().add(lock_key, 1, 5)
+        with mock.patch.object(likes, 'STATE_LOCK_TIMEOUT', 0):
+            response = self.client.post(self.like_url)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertIsNotNone(likes.states_cache().get(lock_key))
+        self.assertEqual(likes.likes_count(self.post), 0)
+
+    def test_expired_pending(self):
+        """Истёкшее незаписанное изменение не превращается в
+        отрицательное при сбросе буфера"""
+
+        self.like(self.like_url)
+        cache.delete(likes.pending_key(likes.POST, self.post.pk))
+        likes.flush_likes()
+
+        self.assertIsNone(cache.get(likes.pending_key(likes.POST,
+                                                      self.post.pk)))
+        self.assertEqual(likes.likes_count(Post.objects.get()), 1)
+
+    def test_comment_like(self):
+        """Лайк комментария считается отдельно от лайка поста"""
+
+        url = reverse('posts:like_comment', kwargs={
+            'post_id': self.post.pk, 'comment_id': self.comment.pk})
+        self.assertEqual(self.like(url), {'liked': True, 'likes_count': 1})
+        self.like(self.like_url)
+        likes.flush_likes()
+
+        self.comment.refresh_from_db()
+        self.post.refresh_from_db()
+        self.assertEqual(self.comment.likes_count, 1)
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertEqual(Like.objects.count(), 2)
+
+        response = self.client.get(reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}))
+        self.assertTrue(response.context['post'].liked)
+        self.assertTrue(response.context['comments'][0].liked)
+
+    def test_anonymous_and_get(self):
+        """Лайкать может только вошедший пользователь и только POST"""
+
+        self.assertEqual(self.client.get(self.like_url).status_code, 405)
+        response = Client().post(self.like_url)
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(likes.buffer.states)
+
+    def test_index_uses_stored_count(self):
+        """Ленты показывают денормализованный счётчик без обращений к
+        таблице лайков"""
+
+        self.like(self.like_url)
+        likes.flush_likes()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = Client().get(reverse('posts:index'))
+        self.assertContains(response, 'Нравится: 1')
+        self.assertFalse([query for query in queries.captured_queries
+                          if 'posts_like' in query['sql']])
@@ -0,0 +1,132 @@
+import json
+from http import HTTPStatus
+from unittest import mock
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import Client, TestCase, override_settings
+from django.urls import path, reverse
+
+from core.metrics import REGISTRY, sql_shape
+from ..models import Comment, Group, Post, User
+
+
+def comment_authors(request, post_id):
+    # Автор каждого комментария загружается отдельным запросом
+    return HttpResponse(', '.join(
+        comment.author.username
+        for comment in Comment.objects.filter(post_id=post_id)
+    ))
+
+
+urlpatterns = [
+    path('n-plus-one/<int:post_id>/', comment_authors, name='n_plus_one'),
+]
+
+
+class RequestMetricsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        REGISTRY.reset()
+        self.client = Client()
+        self.user = User.objects.create_user(username='author')
+        self.group = Group.objects.create(title='Группа', slug='group',
+                                          description='Описание')
+        self.post = Post.objects.create(text='Пост', author=self.user,
+                                        group=self.group)
+
+    def test_sql_shape(self):
+        """Форма запроса не зависит от значений параметров"""
+
+        self.assertEqual(
+            sql_shape('SELECT * FROM t WHERE id IN (%s, %s, %s) AND a = 1'),
+            sql_shape("SELECT * FROM t WHERE id IN (%s) AND a = 'b'")
+        )
+
+    def test_request_metrics_logged(self):
+        """На каждый запрос пишется строка с метриками вьюхи"""
+
+        with self.assertLogs('core.metrics', level='INFO') as logs:
+            self.client.get(reverse('posts:index'))
+            self.client.get(reverse('posts:index'))
+        first, second = (json.loads(line.split(':', 2)[2])
+                         for line in logs.output)
+
+        self.assertEqual(first['view'], 'posts:index')
+        self.assertEqual(first['status'], HTTPStatus.OK)
+        self.assertGreater(first['queries'], 0)
+        self.assertGreater(first['template_ms'], 0)
+        self.assertGreater(first['cache_misses'], 0)
+        self.assertGreater(second['cache_hits'], 0)
+        self.assertLess(second['queries'], first['queries'])
+
+    @override_settings(ROOT_URLCONF='posts.tests.test_metrics')
+    def test_n_plus_one_detected(self):
+        """Повторяющиеся запросы одной формы помечаются как N+1"""
+
+        self.create_comments()
+        with self.assertLogs('core.metrics', level='WARNING') as logs:
+            self.client.get(f'/n-plus-one/{self.post.pk}/')
+        record = json.loads(logs.output[0].split(':', 2)[2])
+
+        self.assertEqual(record['view'], 'n_plus_one')
+        self.assertTrue(record['n_plus_one'])
+
+    def test_post_detail_without_n_plus_one(self):
+        """Авторы комментариев на странице поста загружаются одним
+        запросом"""
+
+        self.create_comments()
+        with self.assertLogs('core.metrics', level='INFO') as logs:
+            self.client.get(reverse('posts:post_detail',
+                                    args=(self.post.pk,)))
+        record = json.loads(logs.output[0].split(':', 2)[2])
+
+        self.assertEqual(record['view'], 'posts:post_detail')
+        self.assertNotIn('n_plus_one', record)
+
+    def create_comments(self):
+        for i in range(10):
+            author = User.objects.create_user(username=f'user{i}')
+            Comment.objects.create(post=self.post, author=author,
+                                   text=f'Комментарий {i}')
+
+    def test_nested_templates_counted_once(self):
+        """Карточки постов рендерятся внутри страницы, и их время не
+        прибавляется к её времени второй раз"""
+
+        with mock.patch('core.template_backends.record_template') as record:
+            self.client.get(reverse('posts:index'))
+        self.assertEqual(record.call_count, 1)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_endpoint(self):
+        """Метрики отдаются в формате Prometheus сотрудникам и по токену,
+        адрес клиента доступа не даёт"""
+
+        self.client.get(reverse('posts:index'))
+        for address in ('127.0.0.1', '10.0.0.1'):
+            with self.subTest(address=address):
+                response = self.client.get(reverse('metrics'),
+                                           REMOTE_ADDR=address)
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.NOT_FOUND)
+        response = self.client.get(reverse('metrics'),
+                                   HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+        response = self.client.get(reverse('metrics'),
+                                   HTTP_AUTHORIZATION='Bearer secret')
+        body = response.content.decode()
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertIn('yatube_request_duration_seconds_count'
+                      '{view="posts:index"} 1', body)
+        self.assertIn('yatube_db_queries_total{view="posts:index"}', body)
+        self.assertIn('yatube_cache_misses_total{view="posts:index"}', body)
+
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
@@ -0,0 +1,82 @@
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, User
+
+# Полный проход по таблице (SCAN без индекса) и сортировка всей выборки во
+# временном B-дереве. Проход по индексу (SCAN ... USING INDEX) и поиск по
+# индексу (SEARCH) допустимы. SQLite до 3.36 пишет SCAN TABLE и псевдоним
+# через AS
+FULL_SCAN_RE = re.compile(r'^SCAN (TABLE )?(?P<table>\w+)( AS \w+)?$'
+                          r'|^USE TEMP B-TREE FOR ORDER BY$')
+# Таблицы, которые читаются целиком намеренно: список знаменитостей мал и
+# кэшируется
+WHOLE_TABLES = frozenset(('posts_celebrity',))
+
+
+class QueryPlanTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.group = Group.objects.create(title='Группа', slug='group',
+                                          description='Описание')
+        Post.objects.bulk_create([
+            Post(text=f'Пост № {i}', author=self.author, group=self.group)
+            for i in range(15)
+        ])
+        self.post = Post.objects.first()
+        self.comment = Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий')
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def full_scans(self, queries):
+        scans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT'):
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = cursor.fetchall()
+                # Пустой план значит, что проверять было нечего
+                self.assertTrue(plan, sql)
+                for row in plan:
+                    scan = FULL_SCAN_RE.match(row[-1])
+                    if scan and scan.group('table') not in WHOLE_TABLES:
+                        scans.append(f'{row[-1]}: {sql}')
+        return scans
+
+    def test_views_use_indexes(self):
+        """Ни один запрос вьюх не читает таблицу целиком и не сортирует
+        выборку без индекса"""
+
+        addresses = (
+            reverse('posts:index'),
+            reverse('posts:index') + '?page=2',
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk})
+            + f'?thread={self.comment.pk}',
+            reverse('posts:follow_index'),
+            reverse('posts:search') + '?q=пост',
+            reverse('posts:popular'),
+            reverse('posts:group_popular', kwargs={'slug': self.group.slug}),
+        )
+        for address in addresses:
+            with self.subTest(address=address):
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    self.client.get(address)
+                scans = self.full_scans(queries.captured_queries)
+                self.assertEqual(scans, [], '\n'.join(scans))
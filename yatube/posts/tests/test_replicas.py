@@ -0,0 +1,108 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from django.contrib.sessions.models import Session
+from django.db import connection, router
+from django.http import HttpResponse
+from django.test import (Client, RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.urls import reverse
+
+from core.db.replicas import STICKY_SESSION_KEY, copy_database, use_replica
+from ..models import AuthorStats, Post, User
+
+
+@use_replica
+def read_database(request):
+    return HttpResponse(f'{router.db_for_read(Post)} '
+                        f'{router.db_for_read(Session)} '
+                        f'{router.db_for_write(Post)}')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTest(SimpleTestCase):
+    def request(self, method='get', session=None):
+        request = getattr(RequestFactory(), method)('/')
+        request.session = session or {}
+        return read_database(request).content.decode()
+
+    def test_routing(self):
+        """Вьюха с декоратором читает посты с реплики, а сессии и все
+        записи идут в основную базу"""
+
+        self.assertEqual(self.request(), 'replica default default')
+        self.assertEqual(self.request('post'), 'default default default')
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+    def test_sticky_session(self):
+        """Недавно писавший пользователь читает основную базу"""
+
+        sticky = {STICKY_SESSION_KEY: time.time() + 30}
+        self.assertEqual(self.request(session=sticky),
+                         'default default default')
+        expired = {STICKY_SESSION_KEY: time.time() - 1}
+        self.assertEqual(self.request(session=expired),
+                         'replica default default')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaStickinessTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='author')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def test_writes_make_session_sticky(self):
+        """После записи сессия помечается, после чтения - нет"""
+
+        self.client.get(reverse('posts:index'))
+        self.assertNotIn(STICKY_SESSION_KEY, self.client.session)
+
+        self.client.post(reverse('posts:post_create'), {'text': 'Пост'})
+        self.assertGreater(self.client.session[STICKY_SESSION_KEY],
+                           time.time())
+
+    def test_missing_stats_not_written(self):
+        """Страницы автора без записи счётчиков считают их, но ничего не
+        пишут: запись в основную базу не читалась бы с реплики"""
+
+        author = User.objects.create_user(username='new_author')
+        post = Post.objects.create(text='Пост', author=author)
+        AuthorStats.objects.filter(user=author).delete()
+
+        pages = (
+            (reverse('posts:profile', kwargs={'username': author.username}),
+             'stats'),
+            (reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+             'author_stats'),
+        )
+        for address, name in pages:
+            with self.subTest(address=address):
+                response = self.client.get(address)
+                self.assertEqual(response.context[name].posts_count, 1)
+        self.assertFalse(AuthorStats.objects.filter(user=author).exists())
+        self.assertNotIn(STICKY_SESSION_KEY, self.client.session)
+
+
+class CopyDatabaseTest(TransactionTestCase):
+    def test_copy_database(self):
+        """Копия основной базы в файле SQLite содержит закоммиченные
+        данные"""
+
+        user = User.objects.create_user(username='author')
+        Post.objects.create(text='Пост для реплики', author=user)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'replica.sqlite3')
+
+        copy_database(connection, path)
+
+        replica = sqlite3.connect(path)
+        self.addCleanup(replica.close)
+        self.assertEqual(
+            replica.execute('SELECT text FROM posts_post').fetchall(),
+            [('Пост для реплики',)]
+        )
@@ -0,0 +1,97 @@
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import AuthorStats, Comment, Post, User
+from ..threads import path_segment, rebuild_paths
+
+
+class CommentThreadsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.client = Client()
+        self.client.force_login(self.author)
+        self.post = Post.objects.create(text='Пост', author=self.author)
+        self.detail = reverse('posts:post_detail',
+                              kwargs={'post_id': self.post.pk})
+        # Ветка: first -> reply -> deep -> deeper, second - отдельно
+        self.first = self.comment('Первый')
+        self.second = self.comment('Второй')
+        self.reply = self.comment('Ответ', self.first)
+        self.deep = self.comment('Ответ на ответ', self.reply)
+        self.deeper = self.comment('Глубже', self.deep)
+
+    def comment(self, text, reply_to=None):
+        data = {'text': text}
+        if reply_to is not None:
+            data['reply_to'] = reply_to.pk
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            data
+        )
+        return Comment.objects.get(text=text)
+
+    def test_paths(self):
+        """Путь комментария - путь родителя и его собственный id"""
+
+        self.assertEqual(self.first.path, path_segment(self.first.pk))
+        self.assertEqual(self.deep.path,
+                         self.reply.path + path_segment(self.deep.pk))
+        self.assertEqual(self.deep.depth, 2)
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.replies_count, 1)
+
+        Comment.objects.update(path='', depth=0, replies_count=0)
+        rebuild_paths()
+        self.assertEqual(Comment.objects.get(pk=self.deep.pk).path,
+                         self.deep.path)
+        self.assertEqual(Comment.objects.get(pk=self.first.pk).replies_count,
+                         1)
+
+    def test_thread_order(self):
+        """Ответы выводятся сразу после родителя с отступом уровня"""
+
+        response = self.client.get(self.detail)
+        comments = list(response.context['comments'])
+
+        self.assertEqual(comments, [self.first, self.reply, self.deep,
+                                    self.deeper, self.second])
+        self.assertEqual([comment.level for comment in comments],
+                         [0, 1, 2, 3, 0])
+
+    @override_settings(COMMENT_COLLAPSE_DEPTH=2)
+    def test_collapsed_thread(self):
+        """Глубокие ответы сворачиваются и загружаются поддеревом"""
+
+        response = self.client.get(self.detail)
+        comments = list(response.context['comments'])
+        self.assertEqual(comments, [self.first, self.reply, self.second])
+        self.assertTrue(comments[1].collapsed)
+        thread = reverse('posts:post_comments',
+                         kwargs={'post_id': self.post.pk})
+        self.assertContains(response, f'{thread}?thread={self.reply.pk}')
+
+        response = self.client.get(thread, {'thread': self.reply.pk})
+        comments = list(response.context['comments'])
+        self.assertEqual(comments, [self.deep, self.deeper])
+        self.assertEqual([comment.level for comment in comments], [0, 1])
+
+    def test_delete_subtree(self):
+        """Удаление комментария удаляет ответы на него и исправляет
+        счётчики"""
+
+        self.client.get(reverse(
+            'posts:delete_comment',
+            kwargs={'post_id': self.post.pk, 'comment_id': self.reply.pk}))
+
+        self.assertEqual(
+            set(Comment.objects.values_list('pk', flat=True)),
+            {self.first.pk, self.second.pk}
+        )
+        self.post.refresh_from_db()
+        self.first.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 2)
+        self.assertEqual(self.first.replies_count, 0)
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.author).comments_count, 2)
@@ -0,0 +1,113 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import likes, trending
+from ..models import Group, Post, User
+from ..trending import add_score, event_score, rebuild_trending
+
+
+@override_settings(TRENDING_HALF_LIFE=1.0)
+class TrendingScoreTest(TestCase):
+    def test_decay(self):
+        """Вклад события вдвое меньше, чем у такого же события на период
+        полураспада позже"""
+
+        now = timezone.now()
+        self.assertAlmostEqual(event_score(2, now - timedelta(hours=1)),
+                               event_score(1, now))
+
+    def test_add_and_subtract(self):
+        """События складываются, вычитание возвращает рейтинг назад"""
+
+        now = timezone.now()
+        score = event_score(1, now)
+        doubled = add_score(score, 1, now)
+        self.assertAlmostEqual(doubled, score + 1)
+        self.assertAlmostEqual(add_score(doubled, -1, now), score)
+        self.assertLess(add_score(score, -5, now), score)
+
+
+class TrendingFeedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(likes, 'buffer', likes.LikeBuffer())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(title='Группа', slug='group',
+                                          description='Описание')
+        self.old = Post.objects.create(text='Старый', author=self.author,
+                                       group=self.group)
+        self.new = Post.objects.create(text='Новый', author=self.author)
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def popular(self, **kwargs):
+        cache.clear()
+        address = (reverse('posts:group_popular', kwargs=kwargs) if kwargs
+                   else reverse('posts:popular'))
+        return list(self.client.get(address).context['posts'])
+
+    def test_new_posts_first(self):
+        """Без других событий выше новые посты"""
+
+        self.assertEqual(self.popular(), [self.new, self.old])
+
+    def test_comments_and_likes_raise_score(self):
+        """Комментарии и лайки поднимают пост выше более нового"""
+
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.old.pk}),
+            {'text': 'Комментарий'})
+        self.assertEqual(self.popular(), [self.old, self.new])
+
+        before = Post.objects.get(pk=self.new.pk).trending_score
+        self.client.post(reverse('posts:like_post',
+                                 kwargs={'post_id': self.new.pk}))
+        likes.flush_likes()
+        self.assertGreater(Post.objects.get(pk=self.new.pk).trending_score,
+                           before)
+
+    def test_group_and_size(self):
+        """Популярное в группе - только посты группы, не больше
+        TRENDING_SIZE"""
+
+        self.assertEqual(self.popular(slug=self.group.slug), [self.old])
+        with self.settings(TRENDING_SIZE=1):
+            self.assertEqual(self.popular(), [self.new])
+
+    @override_settings(TRENDING_VIEW_BATCH=2)
+    def test_views_batched(self):
+        """Просмотры уходят в рейтинг пачками по TRENDING_VIEW_BATCH"""
+
+        executor = mock.Mock()
+        address = reverse('posts:post_detail', kwargs={'post_id': self.old.pk})
+        with mock.patch.object(trending, 'get_executor',
+                               return_value=executor), \
+                mock.patch.object(trending.transaction, 'on_commit',
+                                  side_effect=lambda func: func()):
+            for _ in range(5):
+                self.client.get(address)
+        self.assertEqual(
+            executor.submit.call_args_list,
+            [mock.call(trending.record_views, self.old.pk, 2)] * 2)
+
+    def test_rebuild(self):
+        """Пересчёт с нуля даёт тот же рейтинг, что и события по одному"""
+
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.old.pk}),
+            {'text': 'Комментарий'})
+        scores = dict(Post.objects.values_list('pk', 'trending_score'))
+        Post.objects.update(trending_score=0)
+        rebuild_trending()
+        rebuilt = dict(Post.objects.values_list('pk', 'trending_score'))
+        self.assertAlmostEqual(rebuilt[self.new.pk], scores[self.new.pk])
+        self.assertAlmostEqual(rebuilt[self.old.pk], scores[self.old.pk],
+                               places=3)
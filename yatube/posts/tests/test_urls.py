@@ -31,6 +31,7 @@ class URLTestsPosts(TestCase):
             'posts/group_list.html': f'/group/{self.create_group.slug}/',
             'posts/profile.html': f'/profile/{self.user.username}/',
             'posts/post_detail.html': f'/posts/{self.create_post.id}/',
+            'posts/search.html': '/search/?q=заголовок',
         }
         for template, address in templates_url_names.items():
             with self.subTest(address=address):
@@ -1,15 +1,23 @@
+from datetime import timedelta
+from http import HTTPStatus
 import shutil
 import tempfile
 
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
 from django.conf import settings
 from django import forms
 
-from ..models import Post, Group, User
-from ..utils import QUANTITY_POSTS
+from ..models import Celebrity, Comment, Post, Group, User, FeedEntry
+from ..cards import card_key
+from ..feed import FEED_STAMP_KEY
+from ..utils import QUANTITY_COMMENTS, QUANTITY_POSTS
+from ..thumbnails import generate_thumbnails
+from ..threads import rebuild_paths
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -188,6 +196,207 @@ class ViewsTestPosts(TestCase):
                 self.assertEqual(len(response.context['page_obj']),
                                  QUANTITY_POSTS_ON_SECOND_PAGE)
 
+    @override_settings(CURSOR_PAGINATION=True)
+    def test_cursor_paginator(self):
+        """Проверяем курсорную паджинацию: переход по ссылкам «Следующая» и
+        «Предыдущая» отдаёт те же посты, что и постраничный режим"""
+
+        address = reverse('posts:profile',
+                          kwargs={'username': self.user.username})
+        post_list = list(Post.objects.order_by('-pub_date', '-pk'))
+
+        first = self.authorized_client.get(address).context['page_obj']
+        self.assertEqual(list(first), post_list[:QUANTITY_POSTS])
+        self.assertTrue(first.has_next())
+        self.assertFalse(first.has_previous())
+
+        second = self.authorized_client.get(
+            address, {'after': first.next_cursor}).context['page_obj']
+        self.assertEqual(list(second), post_list[QUANTITY_POSTS:])
+        self.assertFalse(second.has_next())
+        self.assertTrue(second.has_previous())
+
+        back = self.authorized_client.get(
+            address, {'before': second.previous_cursor}).context['page_obj']
+        self.assertEqual(list(back), post_list[:QUANTITY_POSTS])
+        self.assertFalse(back.has_previous())
+
+        broken = self.authorized_client.get(address, {'after': 'lol'})
+        self.assertEqual(list(broken.context['page_obj']),
+                         post_list[:QUANTITY_POSTS])
+
+    def test_index_comments_count(self):
+        """Счётчик комментариев на главной странице берётся из поля поста и
+        не требует загрузки самих комментариев"""
+
+        post = Post.objects.first()
+        address = reverse('posts:add_comment', kwargs={'post_id': post.pk})
+        for i in range(3):
+            self.authorized_client.post(address, {'text': f'Коммент {i}'})
+        comment = post.comments.first()
+        self.authorized_client.get(reverse(
+            'posts:delete_comment',
+            kwargs={'post_id': post.pk, 'comment_id': comment.pk}))
+        post.refresh_from_db()
+
+        self.assertEqual(post.comments_count, 2)
+
+        cache.clear()
+        with self.assertNumQueries(2):
+            response = self.guest_client.get(reverse('posts:index'))
+        self.assertEqual(response.context['page_obj'][0].comments_count, 2)
+        self.assertContains(response, 'Комментариев: 2')
+
+    def test_post_detail_comments_pages(self):
+        """Комментарии выводятся страницами вместе с авторами, число
+        запросов не зависит от числа комментариев, следующая страница
+        отдаётся по курсору"""
+
+        post = Post.objects.first()
+        address = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        Comment.objects.bulk_create([
+            Comment(post=post, author=self.user, text=f'Коммент {i}')
+            for i in range(QUANTITY_COMMENTS + 5)
+        ])
+        # bulk_create не отправляет сигналов, пути веток считаем отдельно
+        rebuild_paths()
+        comments = list(Comment.objects.filter(post=post).order_by('pk'))
+        # Первый запрос создаёт статистику автора
+        self.guest_client.get(address)
+
+        with CaptureQueriesContext(connection) as first:
+            response = self.guest_client.get(address)
+        page = response.context['comments']
+        self.assertEqual(list(page), comments[:QUANTITY_COMMENTS])
+        self.assertTrue(page.has_next())
+
+        Comment.objects.bulk_create([
+            Comment(post=post, author=self.user, text='Ещё коммент')
+            for i in range(QUANTITY_COMMENTS)
+        ])
+        rebuild_paths()
+        with CaptureQueriesContext(connection) as second:
+            self.guest_client.get(address)
+        self.assertEqual(len(first), len(second))
+
+        response = self.guest_client.get(
+            reverse('posts:post_comments', kwargs={'post_id': post.pk}),
+            {'after': page.next_cursor}
+        )
+        self.assertEqual(list(response.context['comments']),
+                         list(Comment.objects.filter(post=post)
+                              .order_by('pk')[QUANTITY_COMMENTS:
+                                              QUANTITY_COMMENTS * 2]))
+        self.assertContains(response, comments[QUANTITY_COMMENTS].text)
+
+    def test_reply_to_comment(self):
+        """Ответ на комментарий подставляет обращение только в форму
+        отвечающего и сохраняет связь с исходным комментарием"""
+
+        post = Post.objects.first()
+        author = User.objects.create_user(username='commentator')
+        comment = Comment.objects.create(post=post, author=author,
+                                         text='Комментарий')
+        detail = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+
+        response = self.authorized_client.get(
+            reverse('posts:answer_to_comment',
+                    kwargs={'post_id': post.pk, 'comment_id': comment.pk}),
+            follow=True
+        )
+        self.assertEqual(response.redirect_chain[0][0],
+                         f'{detail}?reply_to={comment.pk}#comment-form')
+        form = response.context['form']
+        self.assertEqual(form.initial, {'text': '@commentator, ',
+                                        'reply_to': comment.pk})
+
+        other_client = Client()
+        other_client.force_login(author)
+        response = other_client.get(detail)
+        self.assertEqual(response.context['form'].initial, {})
+
+        self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.pk}),
+            {'text': '@commentator, ответ', 'reply_to': comment.pk}
+        )
+        reply = Comment.objects.get(text='@commentator, ответ')
+        self.assertEqual(reply.reply_to, comment)
+        self.assertEqual(reply.author, self.user)
+
+        other_post = Post.objects.exclude(pk=post.pk).first()
+        self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': other_post.pk}),
+            {'text': 'Ответ не туда', 'reply_to': comment.pk}
+        )
+        self.assertFalse(Comment.objects.filter(
+            text='Ответ не туда').exists())
+
+    def test_profile_stats(self):
+        """Счётчик постов в профиле берётся из статистики автора и
+        обновляется при создании поста"""
+
+        address = reverse('posts:profile',
+                          kwargs={'username': self.user.username})
+        response = self.guest_client.get(address)
+        self.assertEqual(response.context['stats'].posts_count,
+                         self.TOTAL_POSTS_IN_TESTS)
+
+        self.authorized_client.post(reverse('posts:post_create'),
+                                    {'text': 'Новый пост'})
+        response = self.guest_client.get(address)
+        self.assertContains(
+            response, f'Всего постов: {self.TOTAL_POSTS_IN_TESTS + 1}')
+
+    def test_post_card_cache(self):
+        """Карточки постов берутся из кэша и сбрасываются только у
+        изменённого поста"""
+
+        cache.clear()
+        post, other = Post.objects.all()[:2]
+        self.guest_client.get(reverse('posts:index'))
+        other_key = card_key(other)
+
+        self.assertIsNotNone(cache.get(card_key(post)))
+        self.assertIsNotNone(cache.get(other_key))
+
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            {'text': 'Отредактированный пост', 'group': post.group_id}
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.version, 1)
+        self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.pk}),
+            {'text': 'Комментарий'}
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.version, 2)
+
+        for address in (
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+            reverse('posts:group_list',
+                    kwargs={'slug': self.create_group0.slug}),
+        ):
+            with self.subTest(address=address):
+                response = self.guest_client.get(address)
+                self.assertContains(response, 'Отредактированный пост')
+        self.assertContains(self.guest_client.get(reverse('posts:index')),
+                            'Комментариев: 1')
+        self.assertEqual(card_key(Post.objects.get(pk=other.pk)), other_key)
+
+        version = Post.objects.get(pk=post.pk).version
+        self.user.set_password('new-password')
+        self.user.save()
+        self.create_group0.description = 'Новое описание'
+        self.create_group0.save()
+        self.assertEqual(Post.objects.get(pk=post.pk).version, version)
+
+        self.user.first_name = 'Лев'
+        self.user.save()
+        self.assertContains(self.guest_client.get(reverse('posts:index')),
+                            'Автор: Лев')
+
     def test_z_additional_check(self):
         """Проверка, что созданный пост не попал в группу, для которой
         не был предназначен"""
@@ -244,6 +453,39 @@ class ViewsTestPosts(TestCase):
                     self.assertEqual(response.context[form].image,
                                      'posts/small.gif')
 
+    @override_settings(POST_IMAGE_FORMATS=('WEBP', 'PNG'))
+    def test_thumbnails(self):
+        """Миниатюры и варианты картинки для srcset готовятся заранее, их
+        адреса хранятся в посте и попадают в шаблон"""
+
+        uploaded = SimpleUploadedFile(
+            name='thumb.gif',
+            content=(b'\x47\x49\x46\x38\x39\x61\x02\x00'
+                     b'\x01\x00\x80\x00\x00\x00\x00\x00'
+                     b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+                     b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+                     b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+                     b'\x0A\x00\x3B'),
+            content_type='image/gif'
+        )
+        post = Post.objects.create(text='Пост с миниатюрой',
+                                   author=self.user,
+                                   image=uploaded)
+        self.assertEqual(post.thumbnail_urls, {'card': post.image.url})
+
+        generate_thumbnails(post.pk)
+        post.refresh_from_db()
+        thumbnail_url = post.thumbnail_urls['card']
+
+        self.assertNotEqual(thumbnail_url, post.image.url)
+        response = self.guest_client.get(reverse('posts:post_detail',
+                                                 kwargs={'post_id': post.pk}))
+        self.assertContains(response, thumbnail_url)
+        # WEBP может быть не собран в Pillow, PNG есть всегда
+        self.assertEqual(post.image_sources[-1][0], 'image/png')
+        self.assertContains(response, '<source type="image/png"')
+        self.assertContains(response, '320w')
+
     def test_comment_only_authorized_user(self):
         """Проверка, что комментировать посты может только авторизованный
         пользователь"""
@@ -260,28 +502,36 @@ class ViewsTestPosts(TestCase):
         self.assertRedirects(resp, redir_url)
 
     def test_caches(self):
-        """Проверка работы кеша главной страницы"""
+        """Проверка работы кеша лент: страница отдаётся из кеша, пока не
+        изменится поколение, а сохранение поста сразу сбрасывает кеш"""
 
-        response = self.authorized_client.get(reverse('posts:index'))
-        posts = response.content
-        Post.objects.create(
-            text='test_new_post',
-            author=self.user,
-        )
-        response_old = self.authorized_client.get(reverse('posts:index'))
+        cache.clear()
+        address = reverse('posts:group_list',
+                          kwargs={'slug': self.create_group0.slug})
+        posts = self.guest_client.get(address + '?page=2').content
+        # Обновление через queryset не отправляет сигналов - кеш не сброшен
+        Post.objects.filter(group=self.create_group0).update(text='updated')
+        response_old = self.guest_client.get(address + '?page=2')
         old_posts = response_old.content
 
         self.assertEqual(old_posts, posts)
+        self.assertIsInstance(response_old.context['page_obj'][0], Post)
 
-        cache.clear()
-        response_new = self.authorized_client.get(reverse('posts:index'))
+        Post.objects.create(
+            text='test_new_post',
+            author=self.user,
+            group=self.create_group0,
+        )
+        response_new = self.guest_client.get(address + '?page=2')
         new_posts = response_new.content
 
         self.assertNotEqual(old_posts, new_posts)
+        self.assertContains(response_new, 'updated')
 
 
 class ViewsTestPostsFollow(TestCase):
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         # Создание 1 пользователя
         self.user1 = User.objects.create_user(username='Tester1')
@@ -372,3 +622,298 @@ class ViewsTestPostsFollow(TestCase):
         len_test3 = len(resp3.context['page_obj'])
 
         self.assertNotEqual(len_test3, len_test2)
+
+    def test_feed_entries(self):
+        """Проверка, что лента подписок материализуется при подписке и
+        публикации поста и очищается при отписке"""
+
+        self.auth_user1.get(reverse('posts:profile_follow',
+                                    kwargs={'username': self.user2.username}))
+        self.assertEqual(FeedEntry.objects.filter(user=self.user1).count(),
+                         self.POSTS_FOR_SECOND_USER)
+
+        Post.objects.create(text='textpost', author=self.user2)
+        self.assertEqual(FeedEntry.objects.filter(user=self.user1).count(),
+                         self.POSTS_FOR_SECOND_USER + 1)
+
+        self.auth_user1.get(reverse('posts:profile_unfollow',
+                                    kwargs={'username': self.user2.username}))
+        self.assertFalse(FeedEntry.objects.filter(user=self.user1).exists())
+
+    @override_settings(FEED_CELEBRITY_THRESHOLD=0)
+    def test_celebrity_feed(self):
+        """Посты популярных авторов не раскладываются по лентам, но всё
+        равно попадают в ленту подписок при чтении"""
+
+        self.auth_user1.get(reverse('posts:profile_follow',
+                                    kwargs={'username': self.user2.username}))
+        Post.objects.create(text='textpost', author=self.user2)
+        resp = self.auth_user1.get(reverse('posts:follow_index'))
+
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertEqual(len(resp.context['page_obj']),
+                         self.POSTS_FOR_SECOND_USER + 1)
+
+    @override_settings(FEED_CELEBRITY_THRESHOLD=1)
+    def test_celebrity_mode_changes(self):
+        """Пока автор знаменитость, записи лент его подписчиков не
+        хранятся. Когда подписчиков становится меньше порога, посты и
+        подписки этого периода раскладываются по лентам, а после нового
+        перехода в режим снова удаляются"""
+
+        for client in (self.auth_user1, self.auth_user3):
+            client.get(reverse('posts:profile_follow',
+                               kwargs={'username': self.user2.username}))
+        self.assertTrue(Celebrity.objects.filter(author=self.user2).exists())
+        Post.objects.create(text='Пост знаменитости', author=self.user2)
+        self.assertFalse(FeedEntry.objects.exists())
+
+        self.auth_user3.get(reverse('posts:profile_unfollow',
+                                    kwargs={'username': self.user2.username}))
+        self.assertFalse(Celebrity.objects.exists())
+        self.assertEqual(FeedEntry.objects.filter(user=self.user1).count(),
+                         self.POSTS_FOR_SECOND_USER + 1)
+        response = self.auth_user1.get(reverse('posts:follow_index'))
+        self.assertContains(response, 'Пост знаменитости')
+
+        self.auth_user3.get(reverse('posts:profile_follow',
+                                    kwargs={'username': self.user2.username}))
+        self.assertFalse(FeedEntry.objects.exists())
+        response = self.auth_user1.get(reverse('posts:follow_index'))
+        self.assertContains(response, 'Пост знаменитости')
+
+    def test_follow_page_cache(self):
+        """Лента подписок отдаётся из кэша и отвечает 304, пока не
+        опубликован пост в подписках и не изменились подписки"""
+
+        address = reverse('posts:follow_index')
+        self.auth_user1.get(reverse('posts:profile_follow',
+                                    kwargs={'username': self.user2.username}))
+        response = self.auth_user1.get(address)
+        etag = response['ETag']
+
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('Last-Modified', response)
+        # Только сессия и пользователь, лента не читается
+        with self.assertNumQueries(2):
+            response = self.auth_user1.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+        # Пост автора, на которого нет подписки, ленту не меняет
+        self.auth_user3.post(reverse('posts:post_create'),
+                             {'text': 'Пост без подписчиков'})
+        response = self.auth_user1.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+        self.auth_user2.post(reverse('posts:post_create'),
+                             {'text': 'Новый пост в подписках'})
+        response = self.auth_user1.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertContains(response, 'Новый пост в подписках')
+        self.assertNotEqual(response['ETag'], etag)
+        etag = response['ETag']
+
+        self.auth_user1.get(reverse('posts:profile_unfollow',
+                                    kwargs={'username': self.user2.username}))
+        response = self.auth_user1.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotContains(response, 'Новый пост в подписках')
+
+    def test_follow_page_changes(self):
+        """Новый пост, правка, комментарий и удаление поста в подписках
+        меняют ETag ленты, и она не отдаётся из кэша. Метки подписчиков при
+        этом не пишутся - только метка автора"""
+
+        address = reverse('posts:follow_index')
+        self.auth_user1.get(reverse('posts:profile_follow',
+                                    kwargs={'username': self.user2.username}))
+        follower_stamp = cache.get(FEED_STAMP_KEY.format(self.user1.pk))
+        post = Post.objects.filter(author=self.user2).first()
+        changes = (
+            (lambda: Post.objects.create(text='Новый пост в ленте',
+                                         author=self.user2),
+             'Новый пост в ленте'),
+            (lambda: self.auth_user2.post(
+                reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+                {'text': 'Исправленный пост'}), 'Исправленный пост'),
+            (lambda: self.auth_user3.post(
+                reverse('posts:add_comment', kwargs={'post_id': post.pk}),
+                {'text': 'Комментарий'}), 'Комментариев: 1'),
+            (lambda: Post.objects.get(pk=post.pk).delete(), None),
+        )
+        for change, text in changes:
+            etag = self.auth_user1.get(address)['ETag']
+            change()
+            response = self.auth_user1.get(address, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            if text:
+                self.assertContains(response, text)
+        self.assertNotContains(response, 'Исправленный пост')
+        self.assertEqual(cache.get(FEED_STAMP_KEY.format(self.user1.pk)),
+                         follower_stamp)
+
+
+class ViewsTestSearch(TestCase):
+    def setUp(self):
+        self.guest_client = Client()
+        self.user = User.objects.create_user(username='HasNoName')
+        self.cat_post = Post.objects.create(
+            text='Мой кот любит спать на тёплых батареях',
+            author=self.user,
+        )
+        self.cats_post = Post.objects.create(
+            text='Коты, коты и ещё раз коты',
+            author=self.user,
+        )
+        self.dog_post = Post.objects.create(
+            text='Собака гуляла во дворе',
+            author=self.user,
+        )
+
+    def test_search(self):
+        """Поиск находит посты по другим формам слова и ставит более
+        релевантные посты выше"""
+
+        response = self.guest_client.get(reverse('posts:search'),
+                                         {'q': 'котов'})
+        self.assertEqual(list(response.context['page_obj']),
+                         [self.cats_post, self.cat_post])
+
+        response = self.guest_client.get(reverse('posts:search'),
+                                         {'q': 'тёплая батарея'})
+        self.assertEqual(list(response.context['page_obj']),
+                         [self.cat_post])
+
+    @override_settings(CURSOR_PAGINATION=True)
+    def test_search_keeps_rank_with_cursors(self):
+        """Курсорная паджинация лент не меняет порядок результатов поиска
+        на порядок по дате"""
+
+        Post.objects.filter(pk=self.cats_post.pk).update(
+            pub_date=self.cat_post.pub_date - timedelta(days=1))
+        response = self.guest_client.get(reverse('posts:search'),
+                                         {'q': 'котов'})
+        self.assertEqual(list(response.context['page_obj']),
+                         [self.cats_post, self.cat_post])
+
+    def test_search_index_sync(self):
+        """Поисковый индекс обновляется при изменении и удалении поста"""
+
+        self.dog_post.text = 'Кот гулял во дворе'
+        self.dog_post.save()
+        self.cats_post.delete()
+        response = self.guest_client.get(reverse('posts:search'),
+                                         {'q': 'кот'})
+
+        self.assertEqual(set(response.context['page_obj']),
+                         {self.cat_post, self.dog_post})
+
+
+class ViewsTestConditional(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.author = User.objects.create_user(username='author')
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader = User.objects.create_user(username='reader')
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.group = Group.objects.create(title='Группа', slug='group',
+                                          description='Описание')
+        self.post = Post.objects.create(text='Пост', author=self.author,
+                                        group=self.group)
+        self.addresses = {
+            'post_detail': reverse('posts:post_detail',
+                                   kwargs={'post_id': self.post.pk}),
+            'profile': reverse('posts:profile',
+                               kwargs={'username': self.author.username}),
+            'group_posts': reverse('posts:group_list',
+                                   kwargs={'slug': self.group.slug}),
+        }
+
+    def etags(self, client):
+        return {name: client.get(address)['ETag']
+                for name, address in self.addresses.items()}
+
+    def assertChanged(self, before, after, changed):
+        for name in self.addresses:
+            with self.subTest(name=name):
+                if name in changed:
+                    self.assertNotEqual(before[name], after[name])
+                else:
+                    self.assertEqual(before[name], after[name])
+
+    def test_moved_and_deleted_posts(self):
+        """Перенос поста в другую группу и удаление поста меняют ETag
+        страниц, из которых он пропал, даже если дата последнего изменения
+        их постов осталась прежней"""
+
+        other = Group.objects.create(title='Другая', slug='other',
+                                     description='Описание')
+        Post.objects.create(text='Новее', author=self.author,
+                            group=self.group)
+        group = self.addresses['group_posts']
+        before = self.guest_client.get(group)['ETag']
+        self.post.group = other
+        self.post.save()
+        after = self.guest_client.get(group)['ETag']
+        self.assertNotEqual(before, after)
+
+        old = Post.objects.create(text='Старый', author=self.author,
+                                  group=self.group)
+        Post.objects.filter(pk=old.pk).update(
+            updated_at=self.post.updated_at - timedelta(days=1))
+        before = self.etags(self.guest_client)
+        old.delete()
+        # Счётчик постов автора выводится и на странице поста
+        self.assertChanged(before, self.etags(self.guest_client),
+                           {'post_detail', 'profile', 'group_posts'})
+
+    def test_not_modified(self):
+        """Неизменившиеся страницы отвечают 304 одним запросом к базе без
+        рендеринга"""
+
+        for name, etag in self.etags(self.guest_client).items():
+            with self.subTest(name=name):
+                with self.assertNumQueries(1):
+                    response = self.guest_client.get(
+                        self.addresses[name], HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.NOT_MODIFIED)
+
+    def test_etags_change(self):
+        """ETag меняется только у страниц, которые затронуло изменение"""
+
+        before = self.etags(self.guest_client)
+        self.reader_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            {'text': 'Комментарий'}
+        )
+        after = self.etags(self.guest_client)
+        # Счётчик комментариев выводится и в карточках постов
+        self.assertChanged(before, after,
+                           {'post_detail', 'profile', 'group_posts'})
+
+        # Название группы выводится и в карточках постов
+        self.group.title = 'Новое название'
+        self.group.save()
+        before, after = after, self.etags(self.guest_client)
+        self.assertChanged(before, after,
+                           {'post_detail', 'profile', 'group_posts'})
+
+        # Первый запрос выдаёт CSRF-cookie, который тоже входит в ETag
+        self.etags(self.reader_client)
+        before = self.etags(self.reader_client)
+        self.reader_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.author.username}))
+        after = self.etags(self.reader_client)
+        self.assertChanged(before, after, {'profile'})
+
+        self.author_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.post.pk}),
+            {'text': 'Новый текст', 'group': self.group.pk}
+        )
+        before, after = after, self.etags(self.reader_client)
+        self.assertChanged(before, after,
+                           {'post_detail', 'profile', 'group_posts'})
@@ -0,0 +1,146 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import (CharField, Count, F, OuterRef, Subquery,
+                              Value)
+from django.db.models.functions import (Cast, Coalesce, Concat, Greatest,
+                                        LPad)
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Comment, Post, User
+from .stats import update_stats
+from .utils import QUANTITY_COMMENTS, CursorPage
+
+# Каждый уровень пути - id комментария, дополненный нулями до PATH_STEP
+# цифр, поэтому строки путей сравниваются так же, как числа. В поле пути
+# помещается MAX_DEPTH + 1 уровней, ответы глубже встают рядом с родителем
+PATH_STEP: int = 10
+MAX_DEPTH: int = 255 // PATH_STEP - 1
+# Символ сразу после цифр: все потомки пути p лежат в диапазоне [p, p + ':')
+PATH_END: str = ':'
+
+
+def path_segment(pk):
+    return str(pk).zfill(PATH_STEP)
+
+
+def segment_expression():
+    """То же, что path_segment, но в SQL - для массового пересчёта"""
+
+    return LPad(Cast('pk', CharField()), PATH_STEP, Value('0'))
+
+
+def subtree(comment, include_root=True):
+    """Комментарий и все ответы на него любой глубины: один диапазон
+    индекса (post, path)"""
+
+    comments = Comment.objects.filter(post_id=comment.post_id,
+                                      path__lt=comment.path + PATH_END)
+    if include_root:
+        return comments.filter(path__gte=comment.path)
+    return comments.filter(path__gt=comment.path)
+
+
+class CommentPage(CursorPage):
+    """Страница ветки комментариев, курсор - путь последнего комментария"""
+
+    def __init__(self, object_list, has_next, has_previous, thread=None):
+        super().__init__(object_list, has_next, has_previous)
+        self.thread = thread
+
+    @property
+    def next_cursor(self):
+        if self._has_next:
+            return self.object_list[-1].path
+
+
+def comments_page(post, after=None, thread=None):
+    """Страница комментариев поста в порядке веток: после каждого
+    комментария идут ответы на него. Читается одним запросом по индексу
+    (post, path) вместе с авторами, без рекурсии.
+
+    Ответы глубже COMMENT_COLLAPSE_DEPTH уровней не выводятся: у последнего
+    видимого уровня появляется ссылка «Продолжить ветку», которая
+    загружает поддерево thread тем же способом"""
+
+    comments = Comment.objects.filter(post=post)
+    base_depth = 0
+    if thread is not None:
+        comments = subtree(thread, include_root=False)
+        base_depth = thread.depth + 1
+    last_depth = base_depth + settings.COMMENT_COLLAPSE_DEPTH - 1
+    comments = (comments.filter(depth__lte=last_depth)
+                .select_related('author').order_by('path'))
+    if after and after.isdigit():
+        comments = comments.filter(path__gt=after)
+    else:
+        after = None
+    comments = list(comments[:QUANTITY_COMMENTS + 1])
+    for comment in comments:
+        comment.level = comment.depth - base_depth
+        comment.collapsed = (comment.depth == last_depth
+                             and comment.replies_count > 0)
+    return CommentPage(comments[:QUANTITY_COMMENTS],
+                       has_next=len(comments) > QUANTITY_COMMENTS,
+                       has_previous=after is not None,
+                       thread=thread)
+
+
+def delete_subtree(comment):
+    """Удаляем комментарий вместе с ответами и исправляем счётчики поста,
+    родителя и авторов. Вызывается внутри транзакции"""
+
+    comments = subtree(comment)
+    authors = Counter(comments.values_list('author', flat=True))
+    comments.delete()
+    if comment.reply_to_id is not None:
+        Comment.objects.filter(pk=comment.reply_to_id).update(
+            replies_count=Greatest(F('replies_count') - 1, 0))
+    Post.objects.filter(pk=comment.post_id).update(
+        comments_count=Greatest(
+            F('comments_count') - sum(authors.values()), 0))
+    for author_id, count in authors.items():
+        update_stats(User(pk=author_id), comments=-count)
+
+
+def rebuild_paths(model=Comment):
+    """Пересчитываем пути, глубину и количество ответов всех комментариев
+    по уровням, например после массовой загрузки без сигналов"""
+
+    model.objects.update(path='', depth=0)
+    model.objects.filter(reply_to__isnull=True).update(
+        path=segment_expression())
+    parent = model.objects.filter(pk=OuterRef('reply_to'))
+    # За проход ставим на место один уровень: ответы на уже поставленные
+    while model.objects.filter(path='').exclude(reply_to__path='').update(
+        path=Concat(Subquery(parent.values('path')), segment_expression()),
+        depth=Subquery(parent.values('depth')) + 1
+    ):
+        pass
+    replies = (model.objects.filter(reply_to=OuterRef('pk')).order_by()
+               .values('reply_to').annotate(total=Count('pk'))
+               .values('total'))
+    model.objects.update(replies_count=Coalesce(Subquery(replies), 0))
+
+
+@receiver(post_save, sender=Comment)
+def place_comment(sender, instance, created, raw=False, **kwargs):
+    """Хендлер, который ставит новый комментарий в ветку: путь считается
+    от id, поэтому записывается сразу после вставки"""
+
+    if not created or raw:
+        return
+    parent = instance.reply_to
+    if parent is not None and parent.depth >= MAX_DEPTH:
+        # Глубже путь не помещается: ответ встаёт рядом с родителем
+        parent = parent.reply_to
+    instance.reply_to = parent
+    instance.path = (parent.path if parent else '') + path_segment(
+        instance.pk)
+    instance.depth = parent.depth + 1 if parent else 0
+    Comment.objects.filter(pk=instance.pk).update(
+        reply_to=parent, path=instance.path, depth=instance.depth)
+    if parent is not None:
+        Comment.objects.filter(pk=parent.pk).update(
+            replies_count=F('replies_count') + 1)
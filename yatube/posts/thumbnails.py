@@ -0,0 +1,109 @@
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image, ImageOps
+from sorl.thumbnail import get_thumbnail
+
+from .feed import touch_post_feeds
+from .models import Post
+from .utils import bump_generation
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    """Пул потоков, в котором готовятся миниатюры. Создаётся при первой
+    загрузке картинки"""
+
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails'
+        )
+    return _executor
+
+
+def make_variants(image):
+    """Готовим варианты картинки нескольких ширин в современных форматах для
+    srcset. Форматы, которые не умеет сохранять Pillow, пропускаются"""
+
+    Image.init()
+    formats = [fmt for fmt in settings.POST_IMAGE_FORMATS if fmt in Image.SAVE]
+    if not formats:
+        return {}
+    with image.open('rb'):
+        source = Image.open(image)
+        source.load()
+    has_alpha = 'A' in source.getbands() or 'transparency' in source.info
+    source = source.convert('RGBA' if has_alpha else 'RGB')
+    ratio_width, ratio_height = settings.POST_IMAGE_RATIO
+    widths = ([width for width in settings.POST_IMAGE_WIDTHS
+               if width <= source.width]
+              or [min(settings.POST_IMAGE_WIDTHS)])
+    base = os.path.splitext(os.path.basename(image.name))[0]
+    variants = {}
+    for fmt in formats:
+        extension = fmt.lower()
+        mime = Image.MIME.get(fmt, f'image/{extension}')
+        for width in widths:
+            height = round(width * ratio_height / ratio_width)
+            variant = ImageOps.fit(source, (width, height), Image.LANCZOS)
+            buffer = BytesIO()
+            variant.save(buffer, fmt, quality=settings.POST_IMAGE_QUALITY)
+            name = image.storage.save(
+                f'posts/variants/{base}_{width}.{extension}',
+                ContentFile(buffer.getvalue())
+            )
+            variants.setdefault(mime, []).append(
+                [width, image.storage.url(name)])
+    return variants
+
+
+def generate_thumbnails(post_id):
+    """Готовим миниатюры всех размеров из POST_THUMBNAIL_SIZES и варианты
+    картинки для srcset и сохраняем их адреса в пост, чтобы шаблоны не
+    обращались к Pillow и KV store"""
+
+    close_old_connections()
+    try:
+        post = Post.objects.filter(pk=post_id).only('image').first()
+        if post is None or not post.image:
+            return
+        urls = {
+            name: get_thumbnail(post.image, geometry, **options).url
+            for name, (geometry, options)
+            in settings.POST_THUMBNAIL_SIZES.items()
+        }
+        variants = make_variants(post.image)
+        Post.objects.filter(pk=post_id, image=post.image.name).update(
+            thumbnails=json.dumps(urls),
+            image_variants=json.dumps(variants) if variants else '',
+            version=F('version') + 1,
+            updated_at=timezone.now()
+        )
+        bump_generation(sender=Post)
+        touch_post_feeds([post_id])
+    except Exception:
+        logger.exception('Не удалось подготовить миниатюры поста %s',
+                         post_id)
+    finally:
+        close_old_connections()
+
+
+def enqueue_thumbnails(post):
+    """Ставим подготовку миниатюр в очередь после коммита транзакции"""
+
+    if post.image:
+        transaction.on_commit(
+            lambda: get_executor().submit(generate_thumbnails, post.pk))
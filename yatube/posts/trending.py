@@ -0,0 +1,158 @@
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Comment, Post
+from .utils import cache_generation, post_from_row, post_to_row
+
+logger = logging.getLogger(__name__)
+
+# Рейтинг поста - двоичный логарифм суммы w * 2^(t / T) по его событиям,
+# где w - вес события, t - его время от начала эпохи Unix, T - период
+# полураспада. У всех постов он убывает с одной скоростью, поэтому хранится
+# без пересчёта по времени: порядок постов от этого не меняется, а новое
+# событие прибавляется к одному посту. Логарифм нужен, чтобы не выйти за
+# пределы float
+TRENDING_KEY: str = 'trending:{}:{}'
+VIEWS_KEY: str = 'trending_views:{}'
+# Какая доля суммы остаётся, если вычесть (снятые лайки) всё прибавленное:
+# логарифм нуля не определён
+MIN_REMAINDER: float = 2 ** -20
+BULK_BATCH_SIZE: int = 500
+
+_executor = None
+
+
+def get_executor():
+    """Поток, в котором просмотры записываются в рейтинг. Запись идёт не в
+    запросе: иначе каждый N-й просмотр переключал бы пользователя с реплики
+    на основную базу"""
+
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1,
+                                       thread_name_prefix='trending')
+    return _executor
+
+
+def event_score(weight, when):
+    half_life = settings.TRENDING_HALF_LIFE * 3600
+    return math.log2(weight) + when.timestamp() / half_life
+
+
+def add_score(score, weight, when):
+    """Рейтинг после события веса weight в момент when. Отрицательный вес
+    вычитает ранее прибавленное"""
+
+    if not weight:
+        return score
+    event = event_score(abs(weight), when)
+    if weight > 0:
+        high, low = max(score, event), min(score, event)
+        return high + math.log2(1 + 2 ** (low - high))
+    remainder = 1 - 2 ** (event - score) if event < score else 0
+    return score + math.log2(max(remainder, MIN_REMAINDER))
+
+
+def record(weights, when=None):
+    """Прибавляем события к рейтингам постов: weights - словарь id поста ->
+    суммарный вес. Одна транзакция на все посты"""
+
+    weights = {pk: weight for pk, weight in weights.items() if weight}
+    if not weights:
+        return
+    when = when or timezone.now()
+    with transaction.atomic():
+        scores = Post.objects.filter(pk__in=weights).values_list(
+            'pk', 'trending_score')
+        for pk, score in scores:
+            Post.objects.filter(pk=pk).update(
+                trending_score=add_score(score, weights[pk], when))
+
+
+def record_event(post_id, event, count=1):
+    record({post_id: settings.TRENDING_WEIGHTS[event] * count})
+
+
+def record_views(post_id, count):
+    close_old_connections()
+    try:
+        record_event(post_id, 'view', count)
+    except Exception:
+        logger.exception('Не удалось записать просмотры поста %s', post_id)
+    finally:
+        close_old_connections()
+
+
+def count_view(post_id):
+    """Считаем просмотр в кэше. Каждые TRENDING_VIEW_BATCH просмотров поста
+    попадают в рейтинг одной записью в фоновом потоке"""
+
+    key = VIEWS_KEY.format(post_id)
+    try:
+        views = cache.incr(key)
+    except ValueError:
+        views = 1 if cache.add(key, 1, None) else cache.incr(key)
+    batch = settings.TRENDING_VIEW_BATCH
+    if views % batch == 0:
+        transaction.on_commit(lambda: get_executor().submit(
+            record_views, post_id, batch))
+
+
+def trending_posts(group=None):
+    """Первые TRENDING_SIZE постов по рейтингу, всех или одной группы.
+    Читаются по индексу рейтинга и кэшируются кортежами, как страницы лент,
+    на TRENDING_CACHE_TIME секунд: рейтинги меняются без сигналов"""
+
+    key = TRENDING_KEY.format(cache_generation(),
+                              group.pk if group else 'all')
+    rows = cache.get(key)
+    if rows is None:
+        posts = Post.objects.select_related('group', 'author')
+        if group is not None:
+            posts = posts.filter(group=group)
+        posts = posts.order_by('-trending_score', '-id')
+        rows = [post_to_row(post)
+                for post in posts[:settings.TRENDING_SIZE]]
+        cache.set(key, rows, settings.TRENDING_CACHE_TIME)
+    return [post_from_row(row) for row in rows]
+
+
+def rebuild_trending(post_model=Post, comment_model=Comment):
+    """Пересчитываем рейтинги всех постов, например после массовой загрузки
+    без сигналов. Время лайков не хранится, они считаются поставленными в
+    момент публикации поста. Просмотры не хранятся вовсе и теряются"""
+
+    weights = settings.TRENDING_WEIGHTS
+    scores = {}
+    for pk, pub_date, likes in post_model.objects.values_list(
+            'pk', 'pub_date', 'likes_count').iterator():
+        scores[pk] = add_score(event_score(weights['post'], pub_date),
+                               weights['like'] * likes, pub_date)
+    for post_id, pub_date in comment_model.objects.values_list(
+            'post_id', 'pub_date').iterator():
+        scores[post_id] = add_score(scores[post_id], weights['comment'],
+                                    pub_date)
+    post_model.objects.bulk_update(
+        [post_model(pk=pk, trending_score=score)
+         for pk, score in scores.items()],
+        ('trending_score',), batch_size=BULK_BATCH_SIZE)
+
+
+@receiver(pre_save, sender=Post)
+def score_new_post(sender, instance, raw=False, **kwargs):
+    """Хендлер, который даёт новому посту рейтинг самой публикации: без
+    других событий новые посты выше старых"""
+
+    if raw or not instance._state.adding:
+        return
+    instance.trending_score = event_score(
+        settings.TRENDING_WEIGHTS['post'],
+        instance.pub_date or timezone.now())
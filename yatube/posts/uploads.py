@@ -0,0 +1,99 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from PIL import Image, ImageOps
+
+# Сигнатуры форматов картинок, которые принимаем: формат и пары
+# (смещение, байты), которые все должны совпасть
+IMAGE_SIGNATURES = (
+    ('JPEG', ((0, b'\xff\xd8\xff'),)),
+    ('PNG', ((0, b'\x89PNG\r\n\x1a\n'),)),
+    ('GIF', ((0, b'GIF87a'),)),
+    ('GIF', ((0, b'GIF89a'),)),
+    ('WEBP', ((0, b'RIFF'), (8, b'WEBP'))),
+)
+SIGNATURE_LENGTH: int = 16
+# Метаданные, которые нужны для корректного сохранения картинки
+KEEP_INFO = ('transparency', 'duration', 'loop')
+
+_executor = None
+
+
+class BoundedFileUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загружаемый файл на диск кусками и перестаёт писать, как только
+    файл превысил POST_IMAGE_MAX_UPLOAD_SIZE. Такой файл помечается
+    too_large, а ошибку показывает форма"""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.file.too_large = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.POST_IMAGE_MAX_UPLOAD_SIZE:
+            self.file.too_large = True
+            return None
+        self.file.write(raw_data)
+
+
+def detect_format(file):
+    """Формат картинки по первым байтам файла или None"""
+
+    file.seek(0)
+    header = file.read(SIGNATURE_LENGTH)
+    file.seek(0)
+    for image_format, signatures in IMAGE_SIGNATURES:
+        if all(header[offset:offset + len(magic)] == magic
+               for offset, magic in signatures):
+            return image_format
+    return None
+
+
+def reencode_image(source_path, target_path, max_side):
+    """Пересохраняем картинку с ограничением по большей стороне и без EXIF.
+    Выполняется в отдельном процессе, чтобы декодирование большой картинки
+    не раздувало память веб-воркера"""
+
+    with Image.open(source_path) as image:
+        image_format = image.format
+        # JPEG можно сразу декодировать в уменьшенном виде
+        image.draft(image.mode, (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side))
+        image.info = {key: value for key, value in image.info.items()
+                      if key in KEEP_INFO}
+        image.save(target_path, image_format)
+
+
+def get_executor():
+    """Пул процессов для пересохранения картинок. Процессы запускаются через
+    spawn, чтобы не копировать память и потоки веб-воркера"""
+
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.UPLOAD_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _executor
+
+
+def reencode_in_worker(source_path, target_path):
+    """Пересохраняем картинку в пуле процессов и ждём результата"""
+
+    global _executor
+    try:
+        get_executor().submit(
+            reencode_image,
+            source_path,
+            target_path,
+            settings.POST_IMAGE_MAX_SIDE
+        ).result(timeout=settings.UPLOAD_TIMEOUT)
+    except BrokenProcessPool:
+        # Процесс упал (например, по памяти) - следующий запрос создаст пул
+        _executor = None
+        raise OSError('Процесс пересохранения картинки завершился с ошибкой')
@@ -5,10 +5,40 @@ app_name = 'posts'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('popular/', views.popular, name='popular'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
+    path(
+        'group/<slug:slug>/popular/',
+        views.group_popular,
+        name='group_popular'
+    ),
     path('profile/<str:username>/', views.profile, name='profile'),
+    path('search/', views.search, name='search'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
+    path('posts/<int:post_id>/like/', views.like_post, name='like_post'),
+    path(
+        'posts/<int:post_id>/unlike/',
+        views.like_post,
+        {'liked': False},
+        name='unlike_post'
+    ),
+    path(
+        'posts/<int:post_id>/comments/<int:comment_id>/like/',
+        views.like_comment,
+        name='like_comment'
+    ),
+    path(
+        'posts/<int:post_id>/comments/<int:comment_id>/unlike/',
+        views.like_comment,
+        {'liked': False},
+        name='unlike_comment'
+    ),
     path(
         'posts/<int:post_id>/comment/',
         views.add_comment,
@@ -1,18 +1,124 @@
-from django.core.paginator import Paginator
-from django.db.models.signals import post_save
-from django.dispatch import receiver
+import hashlib
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
 from django.core.cache import cache
+from django.utils import timezone
 
-from .models import Post
+from .models import Comment, Group, Post, User
 
 QUANTITY_POSTS: int = 10
-CACHE_TIME: int = 20
+QUANTITY_COMMENTS: int = 20
+CACHE_TIME: int = 60 * 5
+GENERATION_KEY: str = 'posts_generation'
+CURSOR_DATE_FORMAT: str = '%Y%m%d%H%M%S%f'
+
+
+class CursorPage:
+    """Страница курсорного паджинатора. Вместо номера страницы хранит
+    курсоры первого и последнего поста, по которым строятся ссылки
+    «Предыдущая» и «Следующая»"""
+
+    is_cursor = True
+
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next:
+            return encode_cursor(self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous:
+            return encode_cursor(self.object_list[0])
+
+
+def encode_cursor(post):
+    """Курсор поста (или комментария) - дата публикации и id, по которым
+    сортируется лента"""
+
+    pub_date = timezone.localtime(post.pub_date, timezone.utc)
+    return f'{pub_date.strftime(CURSOR_DATE_FORMAT)}_{post.pk}'
+
+
+def decode_cursor(cursor):
+    """Разбираем курсор обратно в пару (дата публикации, id). Для
+    испорченного курсора возвращаем None - будет показана первая страница"""
 
+    try:
+        raw_date, raw_pk = cursor.split('_')
+        pub_date = datetime.strptime(raw_date, CURSOR_DATE_FORMAT)
+        return pub_date.replace(tzinfo=timezone.utc), int(raw_pk)
+    except (AttributeError, ValueError):
+        return None
 
-def paginator(request, post_list):
+
+def cursor_paginator(post_list, after=None, before=None):
+    """Курсорная (keyset) паджинация по паре (pub_date, id): страница
+    выбирается поиском по индексу от курсора, без COUNT(*) и OFFSET, поэтому
+    500-я страница открывается так же быстро, как первая"""
+
+    after = decode_cursor(after) if after else None
+    before = decode_cursor(before) if before else None
+    if before is not None:
+        pub_date, pk = before
+        posts = list(post_list.filter(
+            Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, pk__gt=pk)
+        ).order_by('pub_date', 'pk')[:QUANTITY_POSTS + 1])
+        has_previous = len(posts) > QUANTITY_POSTS
+        posts = posts[:QUANTITY_POSTS][::-1]
+        return CursorPage(posts, has_next=True, has_previous=has_previous)
+
+    post_list = post_list.order_by('-pub_date', '-pk')
+    if after is not None:
+        pub_date, pk = after
+        post_list = post_list.filter(
+            Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk)
+        )
+    posts = list(post_list[:QUANTITY_POSTS + 1])
+    return CursorPage(posts[:QUANTITY_POSTS],
+                      has_next=len(posts) > QUANTITY_POSTS,
+                      has_previous=after is not None)
+
+
+def paginator(request, post_list, cursor=None):
     """Создаём объект паджинатора для разбиения одной страницы со всеми постами
-    на несколько с фиксированным количеством"""
+    на несколько с фиксированным количеством. Курсорная паджинация сортирует
+    по дате, поэтому выборкам с другим порядком (поиск по релевантности)
+    передаётся cursor=False"""
 
+    if cursor is None:
+        cursor = settings.CURSOR_PAGINATION
+    if cursor:
+        return cursor_paginator(post_list,
+                                after=request.GET.get('after'),
+                                before=request.GET.get('before'))
     pagin = Paginator(post_list, QUANTITY_POSTS)
     # Извлечение запрошенной страницы из URL
     page_number = request.GET.get('page')
@@ -21,35 +127,101 @@ def paginator(request, post_list):
     return page_obj
 
 
-@receiver(post_save, sender=Post)
-def my_handler(sender, **kwargs):
-    """Создаём хендлер, который перезаписывает кэш 1 страницы, когда объекты
-    связанные с моделью Post обновляются"""
+def cache_generation():
+    """Текущее поколение кэша лент. Ключи страниц включают его номер, поэтому
+    после увеличения поколения старые страницы просто перестают читаться"""
+
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Начинаем с текущего времени, чтобы после вытеснения счётчика из
+        # кэша не вернуться к номеру, под которым уже лежат старые страницы
+        cache.add(GENERATION_KEY, time.time_ns() // 1000, None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation(sender, update_fields=None, **kwargs):
+    """Хендлер, который сбрасывает кэш всех лент, когда меняются посты,
+    комментарии, группы или пользователи"""
+
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache_generation()
 
-    post_list = (Post.objects.select_related('group', 'author')
-                 .prefetch_related('comments').all())
-    _paginator = Paginator(post_list, QUANTITY_POSTS)
-    page = _paginator.get_page('1')
-    cache.set('index_first_page', page, CACHE_TIME)
 
+for model in (Post, Comment, Group, User):
+    post_save.connect(bump_generation, sender=model)
+    post_delete.connect(bump_generation, sender=model)
 
-def cache_index_first_page(request, post_list):
-    """Функция, которая позволяет закэшировать первую страницу главной
-    страницы"""
 
-    page = None
+def post_to_row(post):
+    """Сжимаем пост до кортежа с полями, которые нужны шаблонам лент"""
 
-    page_number = request.GET.get('page', '1')
-    if page_number == '1':
-        cached_page = cache.get('index_first_page')
-        if cached_page is not None:
-            page = cached_page
+    group = post.group
+    return (post.pk, post.text, post.pub_date, post.image.name,
+            post.author_id, post.author.username,
+            post.author.first_name, post.author.last_name,
+            post.group_id,
+            group.slug if group else None,
+            group.title if group else None,
+            post.comments_count, post.likes_count, post.thumbnails,
+            post.image_variants, post.version)
+
+
+def post_from_row(row):
+    """Собираем пост обратно из кортежа без обращений к базе"""
+
+    (pk, text, pub_date, image, author_id, username, first_name, last_name,
+     group_id, group_slug, group_title, comments_count, likes_count,
+     thumbnails, image_variants, version) = row
+    post = Post(id=pk, text=text, pub_date=pub_date, image=image,
+                author_id=author_id, group_id=group_id,
+                comments_count=comments_count, likes_count=likes_count,
+                thumbnails=thumbnails,
+                image_variants=image_variants, version=version)
+    post.author = User(id=author_id, username=username,
+                       first_name=first_name, last_name=last_name)
+    post.group = (Group(id=group_id, slug=group_slug, title=group_title)
+                  if group_id else None)
+    return post
+
+
+def dump_page(page):
+    rows = [post_to_row(post) for post in page]
+    if getattr(page, 'is_cursor', False):
+        return ('cursor', rows, page.has_next(), page.has_previous())
+    return ('pages', rows, page.number, page.paginator.count)
+
+
+def load_page(data, post_list):
+    mode, rows, *state = data
+    posts = [post_from_row(row) for row in rows]
+    if mode == 'cursor':
+        return CursorPage(posts, *state)
+    number, count = state
+    pagin = Paginator(post_list, QUANTITY_POSTS)
+    # Количество постов уже известно, COUNT(*) повторно не выполняется
+    pagin.count = count
+    return Page(posts, number, pagin)
 
-    if page is None:
-        _paginator = Paginator(post_list, QUANTITY_POSTS)
-        page = _paginator.get_page(page_number)
 
-        if page_number == '1':
-            cache.set('index_first_page', page, CACHE_TIME)
+def cached_page(request, post_list, key):
+    """Кэшируем любую страницу ленты index, group_posts или profile в виде
+    кортежей строк. Ключ включает номер поколения, поэтому сохранение поста
+    не перестраивает кэш, а только увеличивает счётчик"""
 
+    params = '&'.join(f'{name}={request.GET.get(name, "")}'
+                      for name in ('page', 'after', 'before'))
+    digest = hashlib.md5(
+        f'{key}:{settings.CURSOR_PAGINATION}:{params}'.encode()
+    ).hexdigest()
+    cache_key = f'posts_page:{cache_generation()}:{digest}'
+    data = cache.get(cache_key)
+    if data is not None:
+        return load_page(data, post_list)
+    page = paginator(request, post_list)
+    cache.set(cache_key, dump_page(page), CACHE_TIME)
     return page
@@ -1,18 +1,36 @@
+from http import HTTPStatus
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
 
+from core.db.replicas import use_replica
 from .models import Post, Group, Comment, Follow, User
 from .forms import PostForm, CommentForm
-from .utils import paginator, cache_index_first_page
-
-NAME_TO_COMMENT = None
+from .utils import paginator, cached_page
+from .feed import (FEED_PAGE_CACHE_TIME, feed_etag, feed_last_modified,
+                   follow_feed, touch_author_feeds)
+from .stats import get_author_stats, update_stats
+from .search import search_posts
+from .thumbnails import enqueue_thumbnails
+from .threads import comments_page, delete_subtree
+from .conditional import group_etag, post_detail_etag, profile_etag
+from .likes import COMMENT, POST, LikeBusy, mark_likes, set_like
+from .trending import count_view, record_event, trending_posts
 
 
+@use_replica
 def index(request):
     template = 'posts/index.html'
-    post_list = (Post.objects.select_related('group', 'author')
-                 .prefetch_related('comments').all())
-    page = cache_index_first_page(request, post_list)
+    post_list = Post.objects.select_related('group', 'author').all()
+    page = cached_page(request, post_list, 'index')
 
     context = {
         'page_obj': page,
@@ -21,44 +39,128 @@ def index(request):
     return render(request, template, context)
 
 
+@use_replica
+def popular(request):
+    """Популярные посты: самые обсуждаемые, лайкаемые и просматриваемые
+    за последнее время"""
+
+    template = 'posts/popular.html'
+    context = {
+        'posts': trending_posts(),
+    }
+    return render(request, template, context)
+
+
+@use_replica
+def group_popular(request, slug):
+    template = 'posts/popular.html'
+    group = get_object_or_404(Group, slug=slug)
+    context = {
+        'group': group,
+        'posts': trending_posts(group),
+    }
+    return render(request, template, context)
+
+
+@use_replica
+@condition(etag_func=group_etag)
 def group_posts(request, slug):
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
+    post_list = group.posts.select_related('group', 'author').all()
     context = {
         'group': group,
-        'page_obj': paginator(request, post_list),
+        'page_obj': cached_page(request, post_list, f'group:{group.pk}'),
     }
     return render(request, template, context)
 
 
+@use_replica
+@condition(etag_func=profile_etag)
 def profile(request, username):
     template = 'posts/profile.html'
-    user = get_object_or_404(User, username=username)
-    posts = Post.objects.filter(author=user)
+    user = get_object_or_404(User.objects.select_related('stats'),
+                             username=username)
+    posts = Post.objects.filter(author=user).select_related('group',
+                                                            'author')
     if request.user.is_authenticated:
         following = request.user.follower.filter(author=user).exists()
     else:
         following = False
     context = {
         'author': user,
-        'page_obj': paginator(request, posts),
-        'following': following
+        'page_obj': cached_page(request, posts, f'profile:{user.pk}'),
+        'following': following,
+        'stats': get_author_stats(user),
     }
     return render(request, template, context)
 
 
+def search(request):
+    template = 'posts/search.html'
+    query = request.GET.get('q', '').strip()
+    posts = search_posts(query).select_related('group', 'author')
+    context = {
+        'query': query,
+        # Курсор по дате потерял бы сортировку по релевантности
+        'page_obj': paginator(request, posts, cursor=False),
+    }
+    return render(request, template, context)
+
+
+def reply_initial(post, reply_to):
+    """Начальные данные формы комментария для ответа: обращение к автору и
+    сам комментарий. Берутся из параметра запроса, а не из общего
+    состояния, поэтому не смешиваются между пользователями и воркерами"""
+
+    if not reply_to or not reply_to.isdigit():
+        return {}
+    comment = (Comment.objects.filter(pk=reply_to, post=post)
+               .select_related('author').first())
+    if comment is None:
+        return {}
+    return {'text': f'@{comment.author.username}, ', 'reply_to': comment.pk}
+
+
+@use_replica
+@condition(etag_func=post_detail_etag)
 def post_detail(request, post_id):
     template = 'posts/post_detail.html'
-    global NAME_TO_COMMENT
-    post = get_object_or_404(Post, id=post_id)
-    all_comments = Comment.objects.filter(post=post)
-    form = CommentForm(initial={'text': NAME_TO_COMMENT})
-    NAME_TO_COMMENT = None
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group', 'author__stats'),
+        id=post_id
+    )
+    form = CommentForm(
+        initial=reply_initial(post, request.GET.get('reply_to')))
+    comments = comments_page(post)
+    count_view(post.pk)
+    mark_likes(request.user, POST, [post])
+    mark_likes(request.user, COMMENT, comments)
     context = {
         'post': post,
         'form': form,
-        'comments': all_comments
+        'comments': comments,
+        'author_stats': get_author_stats(post.author),
+    }
+    return render(request, template, context)
+
+
+@use_replica
+@condition(etag_func=post_detail_etag)
+def post_comments(request, post_id):
+    """Следующая страница комментариев для кнопки «Показать ещё» или
+    свёрнутая ветка (thread) для ссылки «Продолжить ветку»"""
+
+    template = 'posts/includes/comments.html'
+    post = get_object_or_404(Post.objects.only('author_id'), pk=post_id)
+    thread = request.GET.get('thread', '')
+    thread = (get_object_or_404(Comment, pk=thread, post=post)
+              if thread.isdigit() else None)
+    comments = comments_page(post, request.GET.get('after'), thread)
+    mark_likes(request.user, COMMENT, comments)
+    context = {
+        'post': post,
+        'comments': comments,
     }
     return render(request, template, context)
 
@@ -73,7 +175,10 @@ def post_create(request):
     if form.is_valid():
         file_form = form.save(commit=False)
         file_form.author = request.user
-        file_form.save()
+        with transaction.atomic():
+            file_form.save()
+            update_stats(request.user, posts=1)
+            enqueue_thumbnails(file_form)
         return redirect('posts:profile', file_form.author)
     context = {
         'form': form,
@@ -93,7 +198,14 @@ def post_edit(request, post_id):
         files=request.FILES or None,
         instance=post)
     if form.is_valid():
-        form.save()
+        post = form.save(commit=False)
+        if 'image' in form.changed_data:
+            post.thumbnails = ''
+            post.image_variants = ''
+        with transaction.atomic():
+            post.save()
+            if 'image' in form.changed_data:
+                enqueue_thumbnails(post)
         return redirect('posts:post_detail', post_id)
     context = {
         'form': form,
@@ -107,33 +219,86 @@ def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(
         request.POST,
+        instance=Comment(post=post, author=request.user)
     )
     if form.is_valid():
         comment = form.save(commit=False)
-        comment.author = request.user
-        comment.post = post
-        comment.save()
+        with transaction.atomic():
+            comment.save()
+            Post.objects.filter(pk=post.pk).update(
+                comments_count=F('comments_count') + 1,
+                version=F('version') + 1,
+                updated_at=timezone.now())
+            update_stats(request.user, comments=1)
+            record_event(post.pk, 'comment')
+        touch_author_feeds([post.author_id])
+    return redirect('posts:post_detail', post_id=post_id)
+
+
+def like_response(request, liked, count, post_id):
+    """Ответ на лайк: состояние и счётчик для запроса из JavaScript,
+    иначе возврат на страницу поста"""
+
+    if request.is_ajax():
+        return JsonResponse({'liked': liked, 'likes_count': count})
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
+@require_POST
+def like_post(request, post_id, liked=True):
+    post = get_object_or_404(Post.objects.only('likes_count'), pk=post_id)
+    try:
+        count = set_like(request.user, POST, post, liked)
+    except LikeBusy:
+        return HttpResponse(status=HTTPStatus.CONFLICT)
+    return like_response(request, liked, count, post_id)
+
+
+@login_required
+@require_POST
+def like_comment(request, post_id, comment_id, liked=True):
+    comment = get_object_or_404(
+        Comment.objects.only('post_id', 'likes_count'),
+        pk=comment_id, post_id=post_id)
+    try:
+        count = set_like(request.user, COMMENT, comment, liked)
+    except LikeBusy:
+        return HttpResponse(status=HTTPStatus.CONFLICT)
+    return like_response(request, liked, count, post_id)
+
+
+@use_replica
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=feed_etag, last_modified_func=feed_last_modified)
 def follow_index(request):
     template = 'posts/follow.html'
-    posts = Post.objects.filter(author__following__user=request.user)
+    cache_key = f'follow_page:{request.user.pk}:{feed_etag(request)}'
+    content = cache.get(cache_key)
+    if content is not None:
+        return HttpResponse(content)
+    posts = follow_feed(request.user).select_related('group', 'author')
     context = {
         'page_obj': paginator(request, posts),
     }
-    return render(request, template, context)
+    response = render(request, template, context)
+    cache.set(cache_key, response.content, FEED_PAGE_CACHE_TIME)
+    return response
 
 
 @login_required
 def profile_follow(request, username):
     follow_author = get_object_or_404(User, username=username)
     if follow_author != request.user:
-        Follow.objects.get_or_create(
-            user=request.user,
-            author=follow_author
-        )
+        with transaction.atomic():
+            _, created = Follow.objects.get_or_create(
+                user=request.user,
+                author=follow_author
+            )
+            if created:
+                update_stats(request.user, following=1)
+                update_stats(follow_author, followers=1)
     return redirect('posts:profile', username)
 
 
@@ -141,23 +306,30 @@ def profile_follow(request, username):
 def profile_unfollow(request, username):
     follow_author = get_object_or_404(User, username=username)
     users_follow = request.user.follower.filter(author=follow_author)
-    if users_follow.exists():
-        users_follow.delete()
+    with transaction.atomic():
+        _, deleted = users_follow.delete()
+        if deleted.get(Follow._meta.label):
+            update_stats(request.user, following=-1)
+            update_stats(follow_author, followers=-1)
     return redirect('posts:profile', username)
 
 
 @login_required
 def answer_to_comment(request, post_id, comment_id):
-    need_comment = Comment.objects.get(pk=comment_id)
-    global NAME_TO_COMMENT
-    NAME_TO_COMMENT = f'@{need_comment.author.username}, '
-    return redirect('posts:post_detail', post_id)
+    comment = get_object_or_404(Comment, pk=comment_id, post_id=post_id)
+    address = reverse('posts:post_detail', args=(post_id,))
+    return redirect(f'{address}?reply_to={comment.pk}#comment-form')
 
 
 @login_required
 def delete_comment(request, post_id, comment_id):
-    comment = Comment.objects.get(pk=comment_id)
-    post = Post.objects.get(pk=post_id)
-    if request.user == comment.author or post.author == request.user:
-        comment.delete()
+    comment = get_object_or_404(Comment.objects.select_related('post'),
+                                pk=comment_id, post_id=post_id)
+    if request.user.pk in (comment.author_id, comment.post.author_id):
+        with transaction.atomic():
+            delete_subtree(comment)
+            Post.objects.filter(pk=comment.post_id).update(
+                version=F('version') + 1,
+                updated_at=timezone.now())
+        touch_author_feeds([comment.post.author_id])
     return redirect('posts:post_detail', post_id)
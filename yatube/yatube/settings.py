@@ -12,7 +12,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 
 import os
 
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -55,8 +55,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'core.middleware.ReplicaStickinessMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -74,7 +76,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template_backends.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -91,17 +93,52 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
+# Потоки ASGI-воркера, в которых обрабатываются запросы. Чтение тела
+# запроса и отдача ответа идут в цикле событий и потоков не занимают
+ASGI_THREADS = config('ASGI_THREADS', default=8, cast=int)
+
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# SQLite с WAL: читатели не ждут писателей. Соединения живут между
+# запросами, транзакции сразу берут блокировку записи (BEGIN IMMEDIATE), а
+# запросы вне транзакции повторяются, если база занята
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.db.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=600, cast=int),
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {
+                'journal_mode': 'wal',
+                'synchronous': 'normal',
+                'mmap_size': 256 * 1024 * 1024,
+                # Отрицательное значение - размер в килобайтах
+                'cache_size': -64 * 1024,
+                'busy_timeout': 5000,
+                'temp_store': 'memory',
+            },
+        },
     }
 }
 
+# Реплики для чтения: файлы <имя>.sqlite3 рядом с основной базой, которые
+# обновляет команда sync_replicas. В тестах реплики смотрят в основную базу
+DATABASE_REPLICAS = config('DB_REPLICAS', default='', cast=Csv())
+for alias in DATABASE_REPLICAS:
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME': os.path.join(BASE_DIR, f'{alias}.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['core.db.replicas.ReplicaRouter']
+
+TEST_RUNNER = 'core.runner.TestRunner'
+# Сколько секунд после записи пользователь читает основную базу
+REPLICA_STICKY_TIME = 30
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -160,10 +197,128 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
+# Двухуровневый кеш: LRU в памяти процесса перед общим для всех воркеров
+# кешем. В продакшене общий кеш - Redis (django_redis.cache.RedisCache),
+# локально его заменяет файл SQLite рядом с базой (нужен SQLite 3.35+,
+# бэкенд проверяет версию при создании). Тесты подменяют общий кеш на
+# кеш в памяти (core.runner)
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.TwoTierCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'L1_MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 60,
+            'CHECK_INTERVAL': config('CACHE_CHECK_INTERVAL', default=0.5,
+                                     cast=float),
+        },
+    },
+    'shared': {
+        'BACKEND': config('CACHE_SHARED_BACKEND',
+                          default='core.cache.SQLiteCache'),
+        'LOCATION': config(
+            'CACHE_SHARED_LOCATION',
+            default=os.path.join(BASE_DIR, 'cache.sqlite3')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+}
+
+# Сколько уровней ответов выводить сразу, более глубокие ответы
+# сворачиваются в ссылку «Продолжить ветку»
+COMMENT_COLLAPSE_DEPTH = config('COMMENT_COLLAPSE_DEPTH', default=4,
+                                cast=int)
+
+# Лайки копятся в памяти процесса и пишутся в базу пачкой раз в
+# LIKE_FLUSH_INTERVAL секунд или сразу, когда набралось LIKE_FLUSH_BATCH_SIZE
+LIKE_FLUSH_INTERVAL = config('LIKE_FLUSH_INTERVAL', default=2.0, cast=float)
+LIKE_FLUSH_BATCH_SIZE = config('LIKE_FLUSH_BATCH_SIZE', default=500,
+                               cast=int)
+
+# Популярные посты: вклад события в рейтинг вдвое уменьшается каждые
+# TRENDING_HALF_LIFE часов. Веса событий: сама публикация, комментарий,
+# лайк и просмотр
+TRENDING_HALF_LIFE = config('TRENDING_HALF_LIFE', default=12.0, cast=float)
+TRENDING_WEIGHTS = {
+    'post': 1.0,
+    'comment': 3.0,
+    'like': 2.0,
+    'view': 0.1,
+}
+# Сколько постов выводить в популярных и сколько секунд кэшировать список
+TRENDING_SIZE = 20
+TRENDING_CACHE_TIME = 60
+# Просмотры копятся в кэше и попадают в рейтинг пачками по столько штук
+TRENDING_VIEW_BATCH = 10
+
+# Курсорная паджинация лент вместо постраничной (без COUNT(*) и OFFSET)
+CURSOR_PAGINATION = config('CURSOR_PAGINATION', default=False, cast=bool)
+
+# Миниатюры картинок постов: название -> (геометрия, опции sorl-thumbnail).
+# Готовятся в фоновом пуле потоков при создании и редактировании поста
+POST_THUMBNAIL_SIZES = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+THUMBNAIL_WORKERS = config('THUMBNAIL_WORKERS', default=2, cast=int)
+
+# Варианты картинок постов для srcset: ширины, соотношение сторон и форматы
+# в порядке предпочтения (неподдерживаемые Pillow форматы пропускаются)
+POST_IMAGE_WIDTHS = (320, 640, 960)
+POST_IMAGE_RATIO = (960, 339)
+POST_IMAGE_FORMATS = ('AVIF', 'WEBP')
+POST_IMAGE_QUALITY = 80
+
+# Загрузка картинок: файл пишется на диск кусками и обрезается по размеру,
+# разрешение проверяется до декодирования, а пересохранение без EXIF идёт
+# в отдельном процессе
+FILE_UPLOAD_HANDLERS = ['posts.uploads.BoundedFileUploadHandler']
+POST_IMAGE_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 40_000_000
+POST_IMAGE_MAX_SIDE = 2560
+UPLOAD_WORKERS = config('UPLOAD_WORKERS', default=1, cast=int)
+UPLOAD_TIMEOUT = 30
+# Наибольшее тело запроса, которое примет ASGI-воркер: картинка поста и
+# остальные поля формы. Тела больше отклоняются с кодом 413, не доходя до
+# диска
+ASGI_MAX_BODY_SIZE = POST_IMAGE_MAX_UPLOAD_SIZE + 1024 * 1024
+
+# Карточки постов ключуются версией поста, поэтому могут жить долго
+POST_CARD_CACHE_TIME = 60 * 60 * 24
+
+# Авторы с большим числом подписчиков не раскладываются по лентам подписок
+FEED_CELEBRITY_THRESHOLD = config('FEED_CELEBRITY_THRESHOLD', default=10000,
+                                  cast=int)
+
+# Метрики запросов: /metrics/ доступен сотрудникам и по этому токену
+# (Authorization: Bearer <токен>). Пустой токен - только сотрудникам
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+# Сколько одинаковых по форме SQL-запросов за запрос считается N+1
+N_PLUS_ONE_THRESHOLD = 5
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'metrics': {
+            'format': '%(message)s',
+        },
+    },
+    'handlers': {
+        'metrics': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'metrics',
+        },
+    },
+    'loggers': {
+        # INFO - строка на каждый запрос, WARNING - только N+1
+        'core.metrics': {
+            'handlers': ['metrics'],
+            'level': config('METRICS_LOG_LEVEL', default='WARNING'),
+            'propagate': False,
+        },
+    },
 }
 
 # Mail settings